@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# apertures.py
+
+# binary stimulus apertures of retinotopy.py, computed analytically
+# (for pRF modelling - no screen grabs, no OpenGL context needed)
+#
+# wedges follow SlidingWedge, rings follow SlidingAnnulus, with the same
+# cycleTime, dutyCycleWedge, dutyCycleRing and direction parameters.
+# conventions as psychopy's RadialStim: angles clockwise from vertical,
+# ori positive = clockwise, radius as a fraction of the stimulus radius.
+
+import argparse
+import json
+import numpy as np
+
+# cached polar grids, keyed on (resolution, size, centre)
+_POLAR_GRIDS = {}
+_POLAR_BINS = {}
+# apertures are looked up per pixel in tables over angle / radius bins
+ANGLE_BINS = 2**15  # 0.011 deg
+RADIUS_BINS = 2**14  # of the stimulus radius
+# pixels of the top resolution computed per chunk in exportApertures
+CHUNK_PIXELS = 2**23
+
+
+def polarGrid(resolution=100, size=1.0, centre=(0.0, 0.0), extent=1.0):
+    """
+    Polar coordinates of a square pixel grid (cached).
+
+    The grid covers extent x extent in height units (1.0 = full screen
+    height), centred on the screen. Returns (angle, radius): angle in degrees
+    clockwise from vertical, radius as a fraction of the stimulus radius
+    (size/2) measured from the stimulus centre.
+    """
+    key = (resolution, float(size), tuple(np.asarray(centre, float)), extent)
+    if key not in _POLAR_GRIDS:
+        # pixel centres, y going up (row 0 is the top of the screen)
+        coords = (np.arange(resolution) + 0.5)/resolution*extent - extent/2
+        x = coords[np.newaxis, :] - key[2][0]
+        y = coords[::-1, np.newaxis] - key[2][1]
+        angle = np.degrees(np.arctan2(x, y)) % 360.0
+        radius = np.hypot(x, y)/(size/2.0)
+        angle.flags.writeable = False
+        radius.flags.writeable = False
+        _POLAR_GRIDS[key] = (angle, radius)
+    return _POLAR_GRIDS[key]
+
+
+def polarBins(resolution=100, size=1.0, centre=(0.0, 0.0)):
+    """
+    polarGrid() as (angleBin, radiusBin) uint16 indices (cached).
+
+    Pixels outside the stimulus (radius > 1) get bin ANGLE_BINS /
+    RADIUS_BINS, one past the last real bin, so a lookup table with a False
+    entry there masks them out.
+    """
+    key = (resolution, float(size), tuple(np.asarray(centre, float)))
+    if key not in _POLAR_BINS:
+        angle, radius = polarGrid(resolution, size, centre)
+        outside = radius > 1.0
+        angleBin = np.minimum(angle/360.0*ANGLE_BINS, ANGLE_BINS - 1).astype(np.uint16)
+        radiusBin = np.minimum(radius*RADIUS_BINS, RADIUS_BINS - 1).astype(np.uint16)
+        angleBin[outside] = ANGLE_BINS
+        radiusBin[outside] = RADIUS_BINS
+        _POLAR_BINS[key] = (angleBin, radiusBin)
+    return _POLAR_BINS[key]
+
+
+def _lookup(tables, bins):
+    # (nTimes, nBins + 1) tables of bool -> (nTimes, N, N) apertures
+    apertures = np.empty((len(tables),) + bins.shape, dtype=bool)
+    for k in range(len(tables)):
+        np.take(tables[k], bins, out=apertures[k])
+    return apertures
+
+
+def cycleSpeed(direction, cycleTime):
+    """
+    Same as retinotopy.py: deg/s for wedges, cycles/s of radial phase for rings.
+    """
+    speeds = {'cw': 360.0/cycleTime,
+              'ccw': -360.0/cycleTime,
+              'exp': -1.0/cycleTime,
+              'con': 1.0/cycleTime}
+    return speeds[direction]
+
+
+def wedgeApertures(times, cycleTime=24, dutyCycle=0.125, direction='ccw',
+                   resolution=100, size=1.0, centre=(0.0, 0.0)):
+    """
+    Wedge apertures (nTimes, resolution, resolution) of bool at the given times.
+
+    times are seconds since the start of the first cycle (as globalClock in
+    retinotopy.py). The wedge covers [ori, ori + dutyCycle*360] with
+    ori = cycleSpeed*t, as SlidingWedge.setOri. Evaluated per angle bin
+    (polarBins), so edges are exact to 360/ANGLE_BINS deg.
+    """
+    angleBin, _ = polarBins(resolution, size, centre)
+    ori = cycleSpeed(direction, cycleTime)*np.asarray(times, float)
+    angle = (np.arange(ANGLE_BINS) + 0.5)*360.0/ANGLE_BINS
+    # angle from the leading edge of the wedge, in [0, 360), for every bin
+    relAngle = (angle[np.newaxis] - ori[:, np.newaxis]) % 360.0
+    tables = np.zeros((len(ori), ANGLE_BINS + 1), dtype=bool)
+    tables[:, :-1] = relAngle <= dutyCycle*360.0
+    return _lookup(tables, angleBin)
+
+
+def ringApertures(times, cycleTime=24, dutyCycle=0.25, direction='exp',
+                  nRings=4, resolution=100, size=1.0, centre=(0.0, 0.0)):
+    """
+    Ring apertures (nTimes, resolution, resolution) of bool at the given times.
+
+    Ring n of SlidingAnnulus shows radius r where
+    (r + phase + n*ringWidth) % 1 <= ringWidth, with
+    phase = (cycleSpeed*t) % 1 as in retinotopy.py. Evaluated per radius
+    bin (polarBins), so edges are exact to 1/RADIUS_BINS of the radius.
+    """
+    _, radiusBin = polarBins(resolution, size, centre)
+    ringWidth = dutyCycle/nRings
+    phase = (cycleSpeed(direction, cycleTime)*np.asarray(times, float)) % 1
+    radius = (np.arange(RADIUS_BINS) + 0.5)/RADIUS_BINS
+    # distance (in cycles) from the outer edge of ring 0 - inside the
+    # annulus if it falls within the nRings ring widths
+    u = (ringWidth - phase[:, np.newaxis] - radius[np.newaxis]) % 1.0
+    tables = np.zeros((len(phase), RADIUS_BINS + 1), dtype=bool)
+    tables[:, :-1] = u <= dutyCycle
+    return _lookup(tables, radiusBin)
+
+
+def runTimes(cycleTime=24, nCycles=5, nullPeriod=0.0, dt=1/60.0):
+    """
+    Sample times of a full run, from the trigger. Negative = null period.
+    """
+    nSamples = int(round((nullPeriod + cycleTime*nCycles)/dt))
+    return np.arange(nSamples)*dt - nullPeriod
+
+
+def retinotopyApertures(params, dt=1/60.0, resolution=100, times=None):
+    """
+    Apertures for a whole retinotopy.py run, blank during the null period.
+
+    params uses the same keys as retinotopy.py (direction, cycleTime,
+    nCycles, nullPeriod, dutyCycleWedge, dutyCycleRing, size, centre_x,
+    centre_y); missing keys take retinotopy.py's defaults. dt is the sample
+    interval - the TR, or one frame. Pass times (from runTimes) to compute
+    a chunk of a long run.
+    """
+    direction = params.get('direction', 'ccw')
+    cycleTime = params.get('cycleTime', 24)
+    size = params.get('size', params.get('stimSize', 1.0))
+    centre = (params.get('centre_x', 0.0), params.get('centre_y', 0.0))
+    if times is None:
+        times = runTimes(cycleTime, params.get('nCycles', 5),
+                         params.get('nullPeriod', 0.0), dt)
+    times = np.asarray(times, float)
+
+    if direction in ['cw', 'ccw']:
+        apertures = wedgeApertures(times, cycleTime,
+                                   params.get('dutyCycleWedge', 0.125),
+                                   direction, resolution, size, centre)
+    else:
+        apertures = ringApertures(times, cycleTime,
+                                  params.get('dutyCycleRing', 0.25),
+                                  direction, params.get('nRings', 4),
+                                  resolution, size, centre)
+    apertures[times < 0] = False
+    return apertures
+
+
+def _frameTimes(params, frameRate):
+    return runTimes(params.get('cycleTime', 24), params.get('nCycles', 5),
+                    params.get('nullPeriod', 0.0), 1.0/frameRate)
+
+
+def exportApertures(stem, params, frameRate=60.0, tr=None,
+                    resolutions=(768, 200, 100), chunkSize=None):
+    """
+    Write a retinotopy run's apertures as bit-packed, memory-mappable movies.
+
+    For each resolution N in the pyramid this writes
+      <stem>_res-N_frames.npy  uint8 (nFrames, ceil(N*N/8)) - one frame per
+                               row, np.packbits over row-major pixels
+      <stem>_res-N_tr.npy      uint8 (nVolumes, N, N) - fraction of frames
+                               on within each TR, scaled to 0..255 (if tr)
+    plus <stem>.json describing the files. Only the largest resolution is
+    computed analytically; each of the others is the area average of the
+    one above it (see areaAverage), on where at least half covered, and
+    their TR movies average the coverage. Frames are computed and written in chunks of
+    about CHUNK_PIXELS pixels (or chunkSize frames), so full frame-rate runs
+    never sit in memory.
+    """
+    times = _frameTimes(params, frameRate)
+    nFrames = len(times)
+    if tr:
+        # volumes counted from the trigger (times are negative in the null period)
+        tFromTrigger = np.arange(nFrames)/frameRate
+        volumes = np.floor(tFromTrigger/tr + 1e-9).astype(int)
+        nVolumes = int(np.ceil(nFrames/frameRate/tr - 1e-9))
+    else:
+        nVolumes = 0
+    top = max(resolutions)
+    if chunkSize is None:
+        chunkSize = max(CHUNK_PIXELS//(top*top), 1)
+
+    files = {}
+    outputs = []  # (resolution, frames, trMovie, pending)
+    for resolution in resolutions:
+        nBytes = int(np.ceil(resolution*resolution/8))
+        framesFile = f"{stem}_res-{resolution}_frames.npy"
+        # written sequentially (a memmap would keep every dirty page resident)
+        frames = open(framesFile, 'wb')
+        np.lib.format.write_array_header_1_0(
+            frames, {'descr': '|u1', 'fortran_order': False, 'shape': (nFrames, nBytes)})
+        files[str(resolution)] = {'frames': framesFile}
+        trMovie = None
+        if tr:
+            trFile = f"{stem}_res-{resolution}_tr.npy"
+            trMovie = np.lib.format.open_memmap(trFile, mode='w+', dtype=np.uint8,
+                                                shape=(nVolumes, resolution, resolution))
+            files[str(resolution)]['tr'] = trFile
+        # pending: volume -> [sum of frames, number of frames]
+        outputs.append((resolution, frames, trMovie, {}))
+    # each level is averaged from the one above it (cheaper than from the top)
+    outputs.sort(key=lambda output: -output[0])
+
+    for start in range(0, nFrames, chunkSize):
+        stop = min(start + chunkSize, nFrames)
+        chunk = retinotopyApertures(params, resolution=top, times=times[start:stop])
+        coverage = chunk
+        for (resolution, frames, trMovie, pending) in outputs:
+            if resolution == top:
+                shown = chunk
+            else:
+                coverage = areaAverage(coverage, resolution)
+                shown = coverage >= 0.5
+            frames.write(np.packbits(shown.reshape(stop - start, -1), axis=1).tobytes())
+            if tr:
+                theseVolumes = volumes[start:stop]
+                for volume in np.unique(theseVolumes):
+                    inVolume = theseVolumes == volume
+                    total = pending.setdefault(
+                        volume, [np.zeros((resolution, resolution)), 0])
+                    total[0] += coverage[inVolume].sum(axis=0, dtype=float)
+                    total[1] += np.sum(inVolume)
+                # frames come in order, so earlier volumes are complete
+                _writeVolumes(trMovie, pending, theseVolumes[-1])
+
+    for (resolution, frames, trMovie, pending) in outputs:
+        frames.close()
+        if tr:
+            _writeVolumes(trMovie, pending, None)
+            trMovie.flush()
+        print(f"(apertures) wrote {resolution}x{resolution}: {nFrames} frames"
+              + (f", {nVolumes} volumes" if tr else ""))
+
+    info = {'params': params,
+            'frameRate': frameRate,
+            'tr': tr,
+            'nFrames': nFrames,
+            'nVolumes': nVolumes,
+            'resolutions': list(resolutions),
+            'packing': 'np.packbits(frame.ravel()) per row, row-major, bitorder big',
+            'downsampling': f'area average of the {top}x{top} frames, on if >= 0.5',
+            'trScale': 255,
+            'files': files}
+    with open(f"{stem}.json", 'w') as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def _areaWeights(size, resolution):
+    # pixel i of the coarse grid covers [i*f, (i+1)*f) of the fine one
+    # (f = size/resolution): the fine pixels it overlaps, by how much, and
+    # the same as a (size, resolution) matrix
+    f = size/resolution
+    first = np.floor(np.arange(resolution)*f).astype(int)
+    index = first[np.newaxis] + np.arange(int(np.ceil(f)) + 1)[:, np.newaxis]
+    lo = np.maximum(index, np.arange(resolution)*f)
+    hi = np.minimum(index + 1, (np.arange(resolution) + 1)*f)
+    weights = (np.maximum(hi - lo, 0)/f).astype(np.float32)
+    index = np.minimum(index, size - 1)
+    matrix = np.zeros((size, resolution), dtype=np.float32)
+    np.add.at(matrix, (index, np.arange(resolution)), weights)
+    return index, weights, matrix
+
+
+def areaAverage(frames, resolution):
+    """
+    Fraction of each pixel covered, resampling (n, M, M) frames to N x N.
+
+    Each coarse pixel is the area-weighted mean of the fine pixels it
+    overlaps (for any ratio M/N): a few weighted row gathers straight from
+    the frames, then one matrix product for the columns.
+    """
+    index, weights, matrix = _areaWeights(frames.shape[-1], resolution)
+    if frames.dtype == bool:
+        frames = frames.view(np.uint8)
+    rows = np.zeros((len(frames), resolution, frames.shape[2]), dtype=np.float32)
+    for (i, w) in zip(index, weights):
+        rows += frames[:, i, :]*w[:, np.newaxis]
+    return rows @ matrix
+
+
+def _writeVolumes(trMovie, pending, before):
+    # write out (and forget) summed volumes before this one (all if None)
+    for volume in sorted(pending):
+        if before is not None and volume >= before:
+            break
+        total, nFrames = pending.pop(volume)
+        if volume < trMovie.shape[0]:
+            trMovie[volume] = np.round(255.0*np.clip(total/nFrames, 0, 1)).astype(np.uint8)
+
+
+def readFrames(stem, resolution, start=0, stop=None):
+    """
+    Unpack frames [start, stop) of an exported movie, as bool (n, N, N).
+
+    Only the requested rows are read from disk (memory-mapped).
+    """
+    frames = np.load(f"{stem}_res-{resolution}_frames.npy", mmap_mode='r')
+    packed = np.asarray(frames[start:stop])
+    unpacked = np.unpackbits(packed, axis=1, count=resolution*resolution)
+    return unpacked.reshape(-1, resolution, resolution).astype(bool)
+
+
+def readVolumes(stem, resolution, start=0, stop=None):
+    """
+    TR-averaged apertures [start, stop) as float (n, N, N), fraction of frames on.
+    """
+    trMovie = np.load(f"{stem}_res-{resolution}_tr.npy", mmap_mode='r')
+    return np.asarray(trMovie[start:stop], dtype=float)/255.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='apertures.py')
+    parser.add_argument('-o', '--out', default='apertures', type=str,
+                        help='Output file stem')
+    parser.add_argument('-dir', '--direction',
+                        choices=['exp', 'con', 'cw', 'ccw'], default='ccw',
+                        help='exp(anding) or con(tracting) rings, cw or ccw wedge')
+    parser.add_argument('-ct', '--cycleTime', default=24, type=float,
+                        help='How long to complete one cycle (seconds)')
+    parser.add_argument('-nc', '--nCycles', default=5, type=int,
+                        help='How many blocks?')
+    parser.add_argument('-np', '--nullPeriod', default=0.0,  type=float,
+                        help='Duration of gray screen at start (seconds)')
+    parser.add_argument('-ss', '--stimSize', default=1.0, type=float,
+                        help='Stimulus size (fraction of screen height)')
+    parser.add_argument('-dcw', '--dutyCycleWedge', default=0.125, type=float,
+                        help='Duty cycle for wedge (fraction)')
+    parser.add_argument('-dcr', '--dutyCycleRing', default=0.25, type=float,
+                        help='Duty cycle for ring (fraction)')
+    parser.add_argument('-fr', '--frameRate', default=60.0, type=float,
+                        help='Frame rate of the run (Hz)')
+    parser.add_argument('-tr', '--tr', default=None, type=float,
+                        help='TR (seconds), also write TR-averaged apertures')
+    parser.add_argument('-res', '--resolutions', default=[768, 200, 100],
+                        type=int, nargs='+', help='Pyramid resolutions (pixels)')
+
+    parser.description = '''
+Export the apertures of a retinotopy.py run: bit-packed frames that can be
+memory-mapped, at several resolutions, with TR-averaged versions alongside.
+'''
+    parser.epilog = './apertures.py -dir exp -ct 24 -nc 5 -tr 1.5 -o prf/exp-run1'
+    args = parser.parse_args()
+
+    params = args.__dict__.copy()
+    exportApertures(params.pop('out'), params, params.pop('frameRate'),
+                    params.pop('tr'), params.pop('resolutions'))
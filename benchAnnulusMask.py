@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# benchAnnulusMask.py
+
+# compare frame times of SlidingAnnulus with and without the mask cache
+# (per-frame setMask upload vs. preloaded texture lookup)
+
+# ./benchAnnulusMask.py -nf 600 -nr 4
+
+from psychopy import core
+import numpy as np
+
+# provide a compatibility layer for newer versions of PsychoPy
+# and some site-specific parameters
+import compatibility
+from compatibility import SlidingAnnulus
+
+parser = compatibility.setupParser()
+parser.add_argument('-nf', '--nFrames', default=600, type=int,
+                    help='Number of frames to time per condition')
+parser.add_argument('-nr', '--nRings', default=4, type=int,
+                    help='Number of rings in the annulus')
+parser.add_argument('-ct', '--cycleTime', default=24, type=float,
+                    help='How long to complete one cycle (seconds)')
+
+parser.description = '''
+Benchmark SlidingAnnulus.setPhase: old (setMask every frame) vs new (mask cache)
+'''
+
+args = parser.parse_args()
+
+myWin = compatibility.createWindow()
+myWin.mouseVisible = False
+
+
+def timeAnnulus(annulus, nFrames):
+    """
+    Run the expanding ring animation and return (frame intervals, setPhase costs).
+    """
+    setPhaseCost = np.zeros(nFrames)
+    myWin.frameIntervals = []
+    myWin.recordFrameIntervals = True
+    clock = core.Clock()
+    for i in range(nFrames):
+        g = clock.getTime()
+        annulus.incrementRotation()
+        tStart = core.getTime()
+        annulus.setPhase((-g/args.cycleTime) % 1)
+        setPhaseCost[i] = core.getTime() - tStart
+        annulus.draw()
+        myWin.flip()
+    myWin.recordFrameIntervals = False
+    # first interval includes startup of the loop
+    return np.array(myWin.frameIntervals[1:]), setPhaseCost
+
+
+results = {}
+for label, useMaskCache in [('old (setMask)', False), ('new (cache)', True)]:
+    tStart = core.getTime()
+    annulus = SlidingAnnulus(myWin, pos=(0, 0), size=1.0, nRings=args.nRings,
+                             useMaskCache=useMaskCache)
+    tBuild = core.getTime() - tStart
+    frameTimes, setPhaseCost = timeAnnulus(annulus, args.nFrames)
+    results[label] = (tBuild, frameTimes, setPhaseCost)
+
+print('%%%%%%%%%%%%%%%%%')
+print(f"nRings: {args.nRings}, nFrames: {args.nFrames}")
+for label, (tBuild, frameTimes, setPhaseCost) in results.items():
+    period = np.median(frameTimes)
+    nDropped = np.sum(frameTimes > 1.5*period)
+    print(f"{label:>14}: build {tBuild*1000:7.1f} ms | "
+          f"frame mean {frameTimes.mean()*1000:6.2f} ms, sd {frameTimes.std()*1000:5.2f} ms, "
+          f"max {frameTimes.max()*1000:6.2f} ms, dropped {nDropped} | "
+          f"setPhase mean {setPhaseCost.mean()*1e6:7.1f} us")
+print('%%%%%%%%%%%%%%%%%')
+
+myWin.close()
+core.quit()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# benchStartup.py
+
+# wall time from launching each stimulus script to its first flip.
+# scripts run headless with the simulated device, and stop at the first
+# flip (MRIVIS_REPORT_STARTUP=1, see compatibility._reportStartup).
+
+# ./benchStartup.py -n 5
+# ./benchStartup.py -n 3 -s eccLoc.py retinotopy.py
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# script -> arguments that skip any dialog
+SCRIPTS = {'eccLoc.py': [],
+           'hemiLoc.py': [],
+           'lgnHemiLoc.py': [],
+           'retinotopy.py': [],
+           'oriMap.py': [],
+           'visualLoc.py': ['16', '16', '1', '0', '1', '0.25'],
+           'hemiResp.py': [],
+           'minimalScreenTest.py': []}
+
+parser = argparse.ArgumentParser(prog='benchStartup.py')
+parser.add_argument('-n', '--nRuns', default=5, type=int,
+                    help='Launches per script (the first is usually slowest)')
+parser.add_argument('-s', '--scripts', default=list(SCRIPTS), nargs='+',
+                    help='Scripts to time')
+parser.add_argument('-t', '--timeout', default=120, type=float,
+                    help='Give up on a launch after this long (seconds)')
+parser.description = '''
+Benchmark startup: wall time from launch to the first flip of each script
+'''
+args = parser.parse_args()
+
+env = dict(os.environ, MRIVIS_HEADLESS='1', MRIVIS_SIMULATE='1',
+           MRIVIS_REPORT_STARTUP='1')
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def launch(script):
+    """
+    (time to compatibility imported, time to first flip) in s, or None if it failed.
+    """
+    # perf_counter is system-wide, so it compares with the times the child prints
+    tLaunch = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, script] + SCRIPTS.get(script, []),
+                                cwd=here, env=env, capture_output=True,
+                                text=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    times = {}
+    for line in result.stdout.splitlines():
+        if line.startswith('MRIVIS_'):
+            label, t = line.split()
+            times[label] = float(t) - tLaunch
+    if 'MRIVIS_FIRST_FLIP' not in times:
+        print(f"(benchStartup) {script} did not flip:\n{result.stderr[-2000:]}")
+        return None
+    return times.get('MRIVIS_IMPORTED', np.nan), times['MRIVIS_FIRST_FLIP']
+
+
+print(f"{'script':>22} {'import (s)':>11} {'first flip (s)':>15} {'first run (s)':>14}")
+for script in args.scripts:
+    runs = [launch(script) for n in range(args.nRuns)]
+    runs = [r for r in runs if r is not None]
+    if not runs:
+        print(f"{script:>22} {'failed':>11}")
+        continue
+    imported, firstFlip = np.array(runs).T
+    print(f"{script:>22} {np.median(imported):11.2f} {np.median(firstFlip):15.2f} "
+          f"{firstFlip[0]:14.2f}")
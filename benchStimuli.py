@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# benchStimuli.py
+
+# time the stimulus building blocks one at a time: construction, per-frame
+# update and draw cost, over a sweep of nSegs / nRings / angularRes / texRes.
+# results go to a json file, to compare psychopy versions and projector PCs.
+
+# ./benchStimuli.py -nf 120           # on the stimulus PC
+# ./benchStimuli.py --headless -nf 60  # on a display-less box
+
+from psychopy import core, visual
+from psychopy import __version__ as PSYCHOPY_VERSION
+import ctypes
+import json
+import platform
+import numpy as np
+import pyglet.gl as GL
+
+# provide a compatibility layer for newer versions of PsychoPy
+# and some site-specific parameters
+import compatibility
+from compatibility import SlidingWedge, SlidingAnnulus, FlickeringAnnulus
+from compatibility import BatchedSlidingWedge, BatchedSlidingAnnulus
+
+parser = compatibility.setupParser()
+parser.add_argument('-nf', '--nFrames', default=120, type=int,
+                    help='Number of frames to time per stimulus')
+parser.add_argument('-o', '--out', default=None, type=str,
+                    help='Output json file (default: bench-stimuli-<host>-<time>.json)')
+parser.add_argument('-k', '--only', default=None, type=str,
+                    help='Only run benchmarks whose name contains this')
+
+parser.description = '''
+Benchmark construction, update and draw cost of each stimulus building block
+'''
+
+args = parser.parse_args()
+
+myWin = compatibility.createWindow()
+myWin.mouseVisible = False
+
+
+def sqrXsqrPair(nAngular=360, texRes=128):
+    # +/- contrast pair, as in the localizers (eccLoc, hemiLoc, ...)
+    return [visual.RadialStim(myWin, tex='sqrXsqr', color=color, size=1.0,
+                              visibleWedge=[0, 360], radialCycles=4, angularCycles=8,
+                              interpolate=False, autoLog=False, ori=0, pos=(0, 0),
+                              angularRes=nAngular, texRes=texRes)
+            for color in [1, -1]]
+
+
+def oriGrating(texRes=256):
+    # as in oriMap.py
+    return visual.GratingStim(myWin, tex="sin", mask="raisedCos", texRes=texRes,
+                              color=[1.0, 1.0, 1.0], colorSpace='rgb', opacity=1.0,
+                              size=(18, 18), sf=(1.0, 1.0),
+                              ori=0, depth=0.5, phase=0, autoLog=False)
+
+
+def updateWedge(stim, n):
+    stim.incrementPhase()
+    stim.setOri(n*0.25)
+
+
+def updateAnnulus(stim, n):
+    stim.incrementRotation()
+    stim.setPhase((n/240.0) % 1)
+
+
+def updateFlicker(stim, n):
+    stim.setPhase((n/240.0) % 1)  # toggles the colour
+    stim.setOri(n*0.25)
+
+
+def updatePair(stims, n):
+    # flicker: pick which of the pair is drawn this frame
+    stims.insert(0, stims.pop())
+
+
+def updateGrating(stim, n):
+    stim.setOri(n*0.1)
+    stim.setPhase(n*4/60.0)
+
+
+def updateFixation(stim, n):
+    colors = list(compatibility.FIXATION_INFO['my_colors'].values())
+    stim.setColor(colors[(n // 30) % len(colors)])
+
+
+def drawPair(stims):
+    stims[0].draw()
+
+
+def drawStim(stim):
+    stim.draw()
+
+
+# (name, params, factory, update, draw)
+benchmarks = []
+for nSegs in [3, 6, 12, 24]:
+    benchmarks.append(('SlidingWedge', {'nSegs': nSegs},
+                       lambda p: SlidingWedge(myWin, size=1.0, pos=(0, 0), **p),
+                       updateWedge, drawStim))
+    benchmarks.append(('BatchedSlidingWedge', {'nSegs': nSegs},
+                       lambda p: BatchedSlidingWedge(myWin, size=1.0, pos=(0, 0), **p),
+                       updateWedge, drawStim))
+for nRings in [2, 4, 8]:
+    for useMaskCache in [False, True]:
+        benchmarks.append(('SlidingAnnulus', {'nRings': nRings, 'useMaskCache': useMaskCache},
+                           lambda p: SlidingAnnulus(myWin, size=1.0, pos=(0, 0), **p),
+                           updateAnnulus, drawStim))
+    for angularRes in [90, 180, 360]:
+        benchmarks.append(('BatchedSlidingAnnulus', {'nRings': nRings, 'angularRes': angularRes},
+                           lambda p: BatchedSlidingAnnulus(myWin, size=1.0, pos=(0, 0), **p),
+                           updateAnnulus, drawStim))
+    benchmarks.append(('FlickeringAnnulus', {'nRings': nRings},
+                       lambda p: FlickeringAnnulus(myWin, size=1.0, pos=(0, 0), **p),
+                       updateFlicker, drawStim))
+for angularRes in [100, 360, 720]:
+    for texRes in [64, 128, 256]:
+        benchmarks.append(('sqrXsqrPair', {'nAngular': angularRes, 'texRes': texRes},
+                           lambda p: sqrXsqrPair(**p),
+                           updatePair, drawPair))
+for texRes in [64, 256, 512]:
+    benchmarks.append(('oriGrating', {'texRes': texRes},
+                       lambda p: oriGrating(**p),
+                       updateGrating, drawStim))
+for targetType in ['cross', 'circle']:
+    benchmarks.append(('fixation', {'targetType': targetType},
+                       lambda p: compatibility.createFixation(
+                           myWin, dict(compatibility.FIXATION_INFO, **p)),
+                       updateFixation, drawStim))
+
+if args.only is not None:
+    benchmarks = [b for b in benchmarks if args.only in b[0]]
+
+
+def timeStim(factory, params, update, draw, nFrames):
+    """
+    Construction time, and per-frame update / draw times (s) of one stimulus.
+    """
+    GL.glFinish()
+    tStart = core.getTime()
+    stim = factory(params)
+    GL.glFinish()
+    tConstruct = core.getTime() - tStart
+
+    tUpdate = np.zeros(nFrames)
+    tDraw = np.zeros(nFrames)
+    for n in range(nFrames):
+        tStart = core.getTime()
+        update(stim, n)
+        tUpdate[n] = core.getTime() - tStart
+
+        # glFinish, so the draw time includes the GPU work
+        tStart = core.getTime()
+        draw(stim)
+        GL.glFinish()
+        tDraw[n] = core.getTime() - tStart
+        myWin.flip()
+    # the first frame includes lazy setup (shaders, texture upload)
+    return tConstruct, tUpdate, tDraw
+
+
+results = []
+print(f"{'stimulus':>22} {'params':<40} {'build ms':>9} {'update ms':>10} {'draw ms':>8}")
+for (name, params, factory, update, draw) in benchmarks:
+    tConstruct, tUpdate, tDraw = timeStim(
+        factory, params, update, draw, args.nFrames)
+    results.append({'stimulus': name,
+                    'params': params,
+                    'constructMs': tConstruct*1000,
+                    'firstFrameMs': (tUpdate[0] + tDraw[0])*1000,
+                    'updateMs': {'median': np.median(tUpdate[1:])*1000,
+                                 'mean': tUpdate[1:].mean()*1000,
+                                 'max': tUpdate[1:].max()*1000},
+                    'drawMs': {'median': np.median(tDraw[1:])*1000,
+                               'mean': tDraw[1:].mean()*1000,
+                               'max': tDraw[1:].max()*1000}})
+    print(f"{name:>22} {str(params):<40} {tConstruct*1000:9.1f} "
+          f"{np.median(tUpdate[1:])*1000:10.3f} {np.median(tDraw[1:])*1000:8.3f}")
+
+
+def glString(name):
+    # renderer / version, to tell the projector PCs (and software GL) apart
+    try:
+        return ctypes.cast(GL.glGetString(name), ctypes.c_char_p).value.decode()
+    except Exception:
+        return None
+
+
+info = {'psychopyVersion': str(PSYCHOPY_VERSION),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'host': platform.node(),
+        'glRenderer': glString(GL.GL_RENDERER),
+        'glVersion': glString(GL.GL_VERSION),
+        'headless': compatibility.HEADLESS,
+        'screenSize': [int(x) for x in myWin.size],
+        'nFrames': args.nFrames,
+        'time': compatibility.getTimeStr(),
+        'results': results}
+
+outFile = args.out
+if outFile is None:
+    outFile = f"bench-stimuli-{platform.node()}-{info['time']}.json"
+with open(outFile, 'w') as f:
+    json.dump(info, f, indent=2)
+print(f"(benchStimuli) wrote {outFile}")
+
+myWin.close()
+core.quit()
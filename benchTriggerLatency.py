@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# benchTriggerLatency.py
+
+# latency from a (simulated) scanner trigger to the first stimulus frame,
+# through compatibility.waitForScanner and the background DIN reader.
+# the simulated device knows exactly when each pulse was sent.
+
+# ./benchTriggerLatency.py -n 20 -tr 0.5
+# ./benchTriggerLatency.py -n 20 -pi 0.001 -lat 0.0005   # faster polling, slow USB
+
+import os
+import numpy as np
+
+os.environ['MRIVIS_SIMULATE'] = '1'  # has to be set before compatibility is imported
+
+from psychopy import core
+
+# provide a compatibility layer for newer versions of PsychoPy
+# and some site-specific parameters
+import compatibility
+import simulatedPixx
+
+parser = compatibility.setupParser()
+parser.add_argument('-n', '--nTrials', default=20, type=int,
+                    help='Number of triggers to time')
+parser.add_argument('-tr', '--tr', default=0.5, type=float,
+                    help='Simulated TR (seconds)')
+parser.add_argument('-pi', '--pollInterval', default=compatibility.DIN_POLL_INTERVAL,
+                    type=float, help='DIN reader poll interval (seconds)')
+parser.add_argument('-lat', '--latency', default=0.0, type=float,
+                    help='Simulated USB round trip per register update (seconds)')
+
+parser.description = '''
+Benchmark the latency from a simulated scanner trigger to the first stimulus frame
+'''
+
+args = parser.parse_args()
+
+compatibility.DIN_POLL_INTERVAL = args.pollInterval
+device = simulatedPixx.PROPixxCTRL(tr=args.tr, jitter=0.0, firstTrigger=args.tr,
+                                   latency=args.latency)
+session = compatibility.openDeviceSession(device)
+
+myWin = compatibility.createWindow()
+myWin.mouseVisible = False
+fixation = compatibility.createFixation(myWin)
+
+reader = compatibility.getDinReader()
+detect = np.zeros(args.nTrials)
+syncError = np.zeros(args.nTrials)
+firstFrame = np.zeros(args.nTrials)
+for n in range(args.nTrials):
+    t1, tdelta = compatibility.waitForScanner(myWin, fixation)
+    fixation.draw()
+    myWin.flip()
+    tFlip = core.getTime()
+    # the pulse that started this run, with the host time the reader read it
+    # at; the simulator knows exactly when it was sent
+    pulse = reader.pulses()[0]
+    tTrigger = float(device.toHost(pulse['time']))
+    detect[n] = pulse['host'] - tTrigger
+    syncError[n] = t1 - tTrigger  # t1 is the ClockSync estimate of tTrigger
+    firstFrame[n] = tFlip - tTrigger
+
+print('%%%%%%%%%%%%%%%%%')
+print(f"triggers: {args.nTrials}, TR {args.tr} s, poll interval "
+      f"{args.pollInterval*1000:.1f} ms, register update {args.latency*1000:.2f} ms")
+for label, latency in [('trigger seen', detect), ('onset estimate', syncError),
+                       ('first frame', firstFrame)]:
+    print(f"{label:>14} (ms): median {np.median(latency)*1000:6.2f}, "
+          f"mean {latency.mean()*1000:6.2f}, 95% {np.percentile(latency, 95)*1000:6.2f}, "
+          f"max {latency.max()*1000:6.2f}")
+print(f"register updates: {session.nUpdates}")
+print('%%%%%%%%%%%%%%%%%')
+
+myWin.close()
+core.quit()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# bidsEvents.py
+
+# turn the run records the stimulus scripts save (run-*.npz, see
+# compatibility.saveRun) into BIDS *_events.tsv files with a JSON sidecar.
+# onsets are the measured flip times (relative to the trigger) where the run
+# recorded its flips, and the nominal schedule times otherwise.
+
+# ./bidsEvents.py -sub 01 -o sub-01/func run-*.npz
+# ./bidsEvents.py -sub 01 -ses 02 -o bids/sub-01/ses-02/func sessionDir/
+
+import argparse
+import glob
+import json
+import os
+import numpy as np
+
+parser = argparse.ArgumentParser(prog='bidsEvents.py')
+parser.add_argument('runs', nargs='+',
+                    help='Run records (run-*.npz), or directories of them')
+parser.add_argument('-sub', '--subject', required=True, type=str,
+                    help='BIDS subject label (without sub-)')
+parser.add_argument('-ses', '--session', default=None, type=str,
+                    help='BIDS session label (without ses-)')
+parser.add_argument('-o', '--outDir', default='.', type=str,
+                    help='Where to write the events files')
+parser.description = '''
+Export BIDS events.tsv / events.json for a session of stimulus runs
+'''
+
+
+def findRuns(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, 'run-*.npz'))
+        else:
+            files.append(path)
+    return files
+
+
+def loadRun(filename):
+    with np.load(filename) as data:
+        run = {key: data[key] for key in data.files}
+    for key in ['params', 'stimNames', 'score']:
+        if key in run:
+            run[key] = json.loads(str(run[key]))
+    # json keys are strings
+    run['stimNames'] = {int(k): v for (k, v) in run['stimNames'].items()}
+    return run
+
+
+def flipTimes(run, nominal):
+    """
+    Measured time of the first flip at or after each nominal time (s since
+    the trigger), or the nominal times if the run has no flips / schedule.
+    """
+    nominal = np.asarray(nominal, dtype=float)
+    if 'flipTimes' not in run or 'schedule' not in run or not len(run['flipTimes']):
+        return nominal
+    schedule = run['schedule']
+    frames = np.clip(run['flipFrames'], 0, len(schedule) - 1)
+    shown = schedule['time'][frames]  # nominal time of each flip
+    k = np.searchsorted(shown, nominal)
+    measured = run['flipTimes'][np.minimum(k, len(shown) - 1)]
+    # after the last recorded flip (e.g. the run was stopped): nothing measured
+    return np.where(k < len(shown), measured, nominal)
+
+
+def runEvents(run):
+    """
+    (onset, duration, trial_type, response_time) for every stimulus block,
+    fixation target and button press, in onset order.
+    """
+    events = []
+    if 'schedule' in run:
+        schedule = run['schedule']
+        framePeriod = np.median(np.diff(schedule['time'])) if len(schedule) > 1 else 0.0
+        starts = np.flatnonzero(np.diff(schedule['block'], prepend=-1))
+        ends = np.append(schedule['time'][starts[1:]], schedule['time'][-1] + framePeriod)
+        onsets = flipTimes(run, schedule['time'][starts])
+        offsets = flipTimes(run, ends)
+        if 'flipTimes' in run and len(run['flipTimes']):
+            # the last block ends one refresh after its last flip
+            offsets[-1] = max(offsets[-1], run['flipTimes'][-1] + framePeriod)
+        for (start, onset, offset) in zip(starts, onsets, offsets):
+            stim = int(schedule['stim'][start])
+            if stim:  # blanks are the implicit baseline
+                events.append((onset, offset - onset,
+                               run['stimNames'].get(stim, f'stim{stim}'), np.nan))
+    if 'targetOnsets' in run:
+        fixLength = float(run.get('fixLength', 0.0))
+        for (onset, hit, rt) in zip(flipTimes(run, run['targetOnsets']),
+                                    run['targetHit'], run['targetRT']):
+            events.append((onset, fixLength, 'target_hit' if hit else 'target_miss', rt))
+        for t in run['responses']:
+            events.append((t, 0.0, 'response', np.nan))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def bidsName(run, runNumber, args):
+    task = run['params'].get('task', 'unknown')
+    entities = [f'sub-{args.subject}']
+    if args.session:
+        entities.append(f'ses-{args.session}')
+    entities += [f'task-{task}', f'run-{runNumber:02d}']
+    return '_'.join(entities)
+
+
+def writeEvents(events, filename):
+    with open(filename, 'w') as f:
+        f.write('onset\tduration\ttrial_type\tresponse_time\n')
+        for (onset, duration, trialType, rt) in events:
+            rt = 'n/a' if np.isnan(rt) else f'{rt:.4f}'
+            f.write(f'{onset:.4f}\t{duration:.4f}\t{trialType}\t{rt}\n')
+
+
+def sidecar(run):
+    measured = 'flipTimes' in run and len(run['flipTimes']) > 0
+    return {
+        'TaskName': run['params'].get('task', 'unknown'),
+        'onset': {'Description': 'Seconds from the first scanner trigger, '
+                  + ('measured at the flip that showed the event'
+                     if measured else 'nominal (flips were not recorded)'),
+                  'Units': 's'},
+        'duration': {'Description': 'Event duration', 'Units': 's'},
+        'trial_type': {'Description': 'Stimulus block, fixation target '
+                       '(target_hit / target_miss) or button press (response)'},
+        'response_time': {'Description': 'Reaction time to a fixation target',
+                          'Units': 's'},
+        'StimulusPresentation': {
+            'SoftwareName': 'PsychoPy',
+            'SoftwareVersion': run['params'].get('psychopyVersion', 'n/a')},
+        'TaskScore': run.get('score', {}),
+        'Parameters': run['params']}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    runs = [(loadRun(f), f) for f in findRuns(args.runs)]
+    # number the runs of each task in the order they were acquired
+    runs.sort(key=lambda run: run[0]['params']['savedAt'])
+    os.makedirs(args.outDir, exist_ok=True)
+    runNumbers = {}
+    for (run, filename) in runs:
+        task = run['params'].get('task', 'unknown')
+        runNumbers[task] = runNumbers.get(task, 0) + 1
+        name = os.path.join(args.outDir, bidsName(run, runNumbers[task], args))
+        events = runEvents(run)
+        writeEvents(events, name + '_events.tsv')
+        with open(name + '_events.json', 'w') as f:
+            json.dump(sidecar(run), f, indent=2, default=str)
+        print(f"(bidsEvents) {filename} -> {name}_events.tsv ({len(events)} events)")
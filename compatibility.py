@@ -6,13 +6,34 @@
 #
 # 2025-05-05, ds
 
+import os
+import sys
+
+# headless mode: offscreen, software-rendered window, no trigger wait and no
+# key presses needed - for benchmarking / testing on display-less machines.
+# set with --headless on the command line or MRIVIS_HEADLESS=1. This has to
+# be decided before psychopy (and pyglet) are imported.
+HEADLESS = ('--headless' in sys.argv) or (os.environ.get('MRIVIS_HEADLESS') == '1')
+if HEADLESS:
+    os.environ.setdefault('LIBGL_ALWAYS_SOFTWARE', '1')  # mesa llvmpipe
+    import pyglet
+    pyglet.options['headless'] = True  # EGL, no X server
+
 # import psychopy
-from psychopy import core, visual, event, plugins
+from psychopy import core, visual, event
 from psychopy import __version__ as PSYCHOPY_VERSION
-import sys
 import argparse
+import atexit
+import json
+import platform
 import time
+import ctypes
+import ctypes.util
+import gc
+import queue
+import threading
 import numpy as np
+import pyglet.gl as GL  # for preloaded mask textures
 
 
 # connect to VPixx device
@@ -21,18 +42,10 @@ USE_VPIXX = True
 # default parameters
 CODING_WINDOW = False  # if true, make a small, non-fullscreen window for coding
 SCREEN_SIZE = np.array([1920, 1080])  # size of the screen
-CHECK_TIMING = False
+CHECK_TIMING = False  # measureFrameRate measures (once per setup) instead
 
 # FIXATION stuff, set defaults here.
 FIXATION_INFO = {
-    'nTargsH': 0,
-    'nTargs': 0,
-    'nTargsC': 0,
-    'nTargsF': 0,
-    'targTime': 1000,
-    'targFlag': 0,
-    'color_key': 'white',
-    'fn': 0,
     'targetType': 'cross',  # or 'circle'
     'fixationSize': 0.05,
     'fixationLineWidth': 8.0,
@@ -40,7 +53,11 @@ FIXATION_INFO = {
                   'green': [0, 1, 0],
                   'blue': [0, 0, 1],
                   'yellow': [1, 1, 0]},  # target color
-    'fixLength': 1.0 / 2
+    'fixLength': 1.0 / 2,
+    'targetColor': 'yellow',
+    'targetRate': 0.25,  # fraction of colour changes that are targets
+    'minSpacing': 2,  # colour periods from one target to the next, at least
+    'responseWindow': 1.0  # seconds after target onset a press counts as a hit
 }
 
 BUTTON_CODES = ['1', '2', '3', '4']  # keyboard. fix for VPIXX.
@@ -50,19 +67,154 @@ ALLOW_PAUSE = True
 PAUSE_KEY = 'p'
 PAUSE_TIME = 10  # seconds for e.g screen caputre
 
-if USE_VPIXX:
+# fall back on this if the refresh rate can't be measured
+DEFAULT_FRAME_RATE = 60.0
+
+# one entry per frame of a compiled block schedule (see compileSchedule)
+SCHEDULE_DTYPE = np.dtype([('time', 'f8'),  # nominal frame time from trigger (s)
+                           ('block', 'i2'),  # index into the list of blocks
+                           ('stim', 'i2'),  # stimulus id, 0 = blank
+                           ('polarity', 'i1'),  # +1/-1 contrast, 0 when blank
+                           ('fixation', 'i4')])  # fixation colour period
+
+# one entry per flip in a FrameRecorder
+FRAME_DTYPE = np.dtype([('time', 'f8'),  # core.getTime() just after the flip
+                        ('frame', 'i4'),  # frame / schedule index
+                        ('state', 'i2')])  # stimulus state, e.g. block (-1 null)
+
+# one entry per frame in a FrameJournal (time NaN = not written yet)
+JOURNAL_DTYPE = np.dtype([('time', 'f8'),  # core.getTime() just after the flip
+                          ('frame', 'i4'),  # frame / schedule index
+                          ('stim', 'i2'),  # stimulus id / state, 0 blank / null period
+                          ('ori', 'f4'),  # stimulus orientation (deg)
+                          ('phase', 'f4'),  # stimulus phase / polarity
+                          ('fixColor', 'i1'),  # fixation colour index, -1 none
+                          ('response', 'u1')])  # RESPONSE_* flags seen this frame
+RESPONSE_BUTTON = 1
+RESPONSE_KEY_QUIT = 2
+JOURNAL_FLUSH_INTERVAL = 1.0  # seconds between background flushes
+
+# one entry per DIN log event (see DinLogReader)
+DIN_EVENT_DTYPE = np.dtype([('time', 'f8'),  # device time of the event (s)
+                            ('value', 'u4'),  # DIN state after the event
+                            ('host', 'f8')])  # core.getTime() when it was read
+
+# paired host / device clock readings (see ClockSync)
+SYNC_DTYPE = np.dtype([('host', 'f8'),  # core.getTime(), middle of the round trip
+                       ('device', 'f8'),  # device getTime()
+                       ('roundTrip', 'f8')])  # host time the round trip took
+CLOCK_SYNC_INTERVAL = 0.25  # seconds between clock samples
+
+# ResponsePixx codes on the DIN (right hand 2x5 box, see checkResponsePIXX.py).
+# anything else on the DIN is taken to be a scanner trigger
+PIXX_BUTTON_CODES = {64768: 'blue', 64576: 'yellow', 64544: 'red',
+                     64640: 'green', 65024: 'white', 64512: 'button release'}
+# button presses reported as these keys, so they count like BUTTON_CODES
+PIXX_BUTTON_KEYS = {'blue': '1', 'yellow': '2', 'red': '3', 'green': '4'}
+DIN_POLL_INTERVAL = 0.002  # seconds between DIN log reads
+SCANNER_TR = None  # seconds; None = estimate from the scanner pulses
+MARKER_MASK = 0xFF  # DOUT bits used by frame markers (see markNextFlip)
+MARKER_SYNC_WAIT = 0.025  # seconds for a marker's sync to pass (one refresh at >= 40 Hz)
+WARMUP_FRAMES = 10  # animation frames per stimulus in the warm-up (see registerStim)
+
+# simulated scanner / button box (see simulatedPixx.py), for running off the
+# scanner PC. set with --simulate or MRIVIS_SIMULATE=1; also used if
+# pypixxlib is missing
+SIMULATE = ('--simulate' in sys.argv) or (os.environ.get('MRIVIS_SIMULATE') == '1')
+
+# per-user caches that speed up startup (see activatePlugins, measureFrameRate)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mrivis')
+# measure the refresh rate again even if this display setup is in the cache
+REMEASURE_FRAME_RATE = os.environ.get('MRIVIS_REMEASURE_FRAME_RATE') == '1'
+
+# realtime mode for the scan run (see enterRealtime): on by default, off in
+# headless runs unless asked for. MRIVIS_REALTIME=0 / 1 to choose
+REALTIME = os.environ.get('MRIVIS_REALTIME', '0' if HEADLESS else '1') == '1'
+REALTIME_PRIORITY = 40  # SCHED_FIFO priority, below the kernel's irq threads (50)
+
+# startup benchmark (benchStartup.py): report when things are ready
+REPORT_STARTUP = os.environ.get('MRIVIS_REPORT_STARTUP') == '1'
+
+
+def deviceClass():
+    """
+    The VPixx device class, imported on first use (pypixxlib is slow to load).
+
+    Falls back on the simulated device if pypixxlib is missing.
+    """
+    global SIMULATE
+    if USE_VPIXX and not SIMULATE:
+        try:
+            # digital IO, triggering
+            from pypixxlib.propixx import PROPixxCTRL  #if you have a datapixx3 change this to “from pypixxlib.datapixx import DATAPixx3”
+            print("(compatibility) using pypixxlib")
+            return PROPixxCTRL
+        except ImportError:
+            print("(compatibility) pypixxlib not found. Need this for triggers. etc")
+            SIMULATE = True
+    from simulatedPixx import PROPixxCTRL
+    print("(compatibility) ** SIMULATED VPixx device - triggers are NOT from the scanner **")
+    return PROPixxCTRL
+
+
+def _readCache(name):
+    try:
+        with open(os.path.join(CACHE_DIR, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _writeCache(name, data):
     try:
-        import pypixxlib
-        # digital IO, triggering
-        from pypixxlib.propixx import PROPixxCTRL  #if you have a datapixx3 change this to “from pypixxlib.datapixx import DATAPixx3”
-        # digital IO, triggering
-        from pypixxlib.propixx import PROPixxCTRL  #if you have a datapixx3 change this to “from pypixxlib.datapixx import DATAPixx3”
-        print("(compatibility) using pypixxlib")
-    except ImportError:
-        print("(compatibility) pypixxlib not found. Need this for triggers. etc")
-        pypixxlib = None
-        print("Exiting... for now - need to fix this to use buttons?")
-        core.quit()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, name), 'w') as f:
+            json.dump(data, f, indent=2)
+    except OSError as e:
+        print(f"(compatibility) could not write cache {name}: {e}")
+
+
+def _pluginCacheKey():
+    # installing / removing packages touches the site-packages directories
+    sitePackages = sorted(p for p in sys.path
+                          if p.endswith('-packages') and os.path.isdir(p))
+    return {'psychopy': str(PSYCHOPY_VERSION),
+            'prefix': sys.prefix,
+            'sitePackages': {p: os.path.getmtime(p) for p in sitePackages}}
+
+
+_PLUGINS_ACTIVE = False
+
+
+def activatePlugins():
+    """
+    Activate psychopy plugins (once, on first use - createWindow calls this).
+
+    Plugin discovery is slow, so the plugins found are cached between runs
+    (plugins.json in CACHE_DIR), keyed on the psychopy version and the
+    installed packages. On a cache hit there is no discovery: the cached
+    plugins (if any) are loaded by name. Later calls in the same process
+    return straight away, whatever the first one found.
+    """
+    global _PLUGINS_ACTIVE
+    if _PLUGINS_ACTIVE or str(PSYCHOPY_VERSION) < '2020.1.0':
+        return
+    _PLUGINS_ACTIVE = True
+    key = _pluginCacheKey()
+    cache = _readCache('plugins.json')
+    if cache.get('key') == key and 'unknown' not in cache.get('plugins', ['unknown']):
+        if cache['plugins']:
+            from psychopy import plugins
+            for name in cache['plugins']:
+                plugins.loadPlugin(name)
+        return
+    from psychopy import plugins
+    plugins.activatePlugins()  # needed for modern version
+    try:
+        found = list(plugins.listPlugins('all'))
+    except Exception:
+        found = ['unknown']  # can't tell - discover again next time
+    _writeCache('plugins.json', {'key': key, 'plugins': found})
 
 
 def versionCheck():
@@ -76,7 +228,7 @@ def versionCheck():
         print(
             f"\n(compatibility) modern version of psychopy. version: {PSYCHOPY_VERSION}")
         psychopy_modern = True
-        plugins.activatePlugins()  # needed for modern version
+        # plugins are activated when the window is created (activatePlugins)
         # PatchStim migrated to GratingStim in newer version
         visual.PatchStim = visual.GratingStim
         return True
@@ -85,6 +237,11 @@ def versionCheck():
 def setupParser():
     parser = argparse.ArgumentParser(
         prog=sys.argv[0])
+    # picked up at import time (see HEADLESS), but argparse needs to know it
+    parser.add_argument('--headless', action='store_true',
+                        help='Offscreen software rendering, no trigger / keys (for benchmarks)')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Simulated VPixx device: scripted scanner triggers / buttons')
     return parser
 
 
@@ -95,9 +252,10 @@ def createWindow(units='height'):
     Default units are in height.
     Picks up other GLOBAL settings from the file here!
     """
+    activatePlugins()
     # create window, taking into account debug choices
     screenSize = SCREEN_SIZE/2 if CODING_WINDOW else SCREEN_SIZE
-    fullscr = False if CODING_WINDOW else True
+    fullscr = False if (CODING_WINDOW or HEADLESS) else True
     allowGUI = True if CODING_WINDOW else False
     pos = (50, 50) if CODING_WINDOW else None
     myWin = visual.Window(screenSize,
@@ -110,6 +268,10 @@ def createWindow(units='height'):
                           pos=pos,
                           units=units,
                           winType='pyglet')  # flip X
+    if HEADLESS:
+        # no display to sync to - keep the frame intervals for the report
+        myWin.recordFrameIntervals = True
+        print("(compatibility) headless window (offscreen, software rendering)")
     return myWin
 
 
@@ -162,9 +324,188 @@ def reportTiming(params):
     print(f"TOTAL (s): {totalTime}")
 
 
+# stimuli to draw before the trigger, as (stim, animate)
+_WARMUP_STIMS = []
+
+
+def registerStim(stim, animate=None):
+    """
+    Have waitForScanner draw this stimulus (offscreen) before the trigger.
+
+    If given, animate(n) is called before each of WARMUP_FRAMES extra draws,
+    so the per-frame update path (setters, mask / texture changes) runs too.
+    """
+    _WARMUP_STIMS.append((stim, animate))
+
+
+def warmUp(myWin, nFrames=None):
+    """
+    Draw every registered stimulus into the back buffer, which is then cleared.
+
+    Shader compilation, texture uploads and lazy psychopy setup happen here
+    instead of on the first frames after the trigger. Returns the time taken (s).
+    """
+    if not _WARMUP_STIMS:
+        return 0.0
+    nFrames = WARMUP_FRAMES if nFrames is None else nFrames
+    tStart = core.getTime()
+    for (stim, animate) in _WARMUP_STIMS:
+        stim.draw()
+        if animate is not None:
+            for n in range(nFrames):
+                animate(n)
+                stim.draw()
+    GL.glFinish()  # wait for the GPU, so the time is all in
+    myWin.clearBuffer()
+    tWarmUp = core.getTime() - tStart
+    print(f"(compatibility) warm-up: {len(_WARMUP_STIMS)} stimuli, "
+          f"{nFrames} frames each, {tWarmUp*1000:.1f} ms")
+    return tWarmUp
+
+
+# what enterRealtime() changed, so leaveRealtime() can put it back
+_REALTIME_STATE = None
+
+
+def enterRealtime(cpu=None, priority=None):
+    """
+    Realtime settings for the frame loop (the calling thread): pin it to one
+    CPU, SCHED_FIFO (or failing that psychopy's rush / a lower nice value),
+    lock the process memory, and freeze + disable the garbage collector
+    (collectGarbage() collects in null periods). Each step is tried on its
+    own; what worked is printed and returned. leaveRealtime() undoes it.
+
+    Affinity and scheduler are set for this thread only, so the DIN reader
+    and clock sync threads keep running on the other cores. Threads started
+    later inherit them, so background threads call _normalThread() first.
+    """
+    global _REALTIME_STATE
+    if _REALTIME_STATE is not None:
+        return _REALTIME_STATE['status']
+    priority = REALTIME_PRIORITY if priority is None else priority
+    state = {}
+    status = {}
+
+    try:
+        state['affinity'] = os.sched_getaffinity(0)
+        if cpu is None:
+            cpu = max(state['affinity'])  # the last core is usually the quietest
+        os.sched_setaffinity(0, {cpu})
+        status['affinity'] = f"cpu {cpu}"
+    except (AttributeError, OSError, ValueError) as e:
+        state.pop('affinity', None)
+        status['affinity'] = f"failed ({e})"
+
+    try:
+        state['scheduler'] = (os.sched_getscheduler(0), os.sched_getparam(0))
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        status['scheduler'] = f"SCHED_FIFO {priority}"
+    except (AttributeError, OSError) as e:
+        state.pop('scheduler', None)
+        try:
+            if not core.rush(True):
+                raise OSError('rush not allowed')
+            state['rush'] = True
+            status['scheduler'] = f"core.rush (no SCHED_FIFO: {e})"
+        except Exception:
+            try:
+                state['nice'] = os.nice(0)
+                os.nice(-10)
+                status['scheduler'] = f"nice -10 (no SCHED_FIFO: {e})"
+            except (AttributeError, OSError) as e2:
+                state.pop('nice', None)
+                status['scheduler'] = f"failed ({e2})"
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        MCL_CURRENT, MCL_FUTURE = 1, 2  # linux
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            raise OSError(os.strerror(ctypes.get_errno()))
+        state['libc'] = libc
+        status['mlockall'] = "locked"
+    except (AttributeError, OSError, TypeError) as e:
+        status['mlockall'] = f"failed ({e})"
+
+    # everything alive now (stimuli, psychopy) is moved out of the collector's
+    # way; new garbage only goes when collectGarbage() says so
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+    status['gc'] = f"frozen ({gc.get_freeze_count()} objects), disabled"
+
+    state['status'] = status
+    _REALTIME_STATE = state
+    atexit.register(leaveRealtime)
+    print("(compatibility) realtime: " +
+          ", ".join(f"{key} {value}" for (key, value) in status.items()))
+    return status
+
+
+def _normalThread():
+    # undo inherited realtime settings in a background thread (call from run())
+    state = _REALTIME_STATE
+    if state is None:
+        return
+    try:
+        if 'scheduler' in state:
+            os.sched_setscheduler(0, *state['scheduler'])
+        if 'affinity' in state:
+            os.sched_setaffinity(0, state['affinity'])
+    except (AttributeError, OSError):
+        pass
+
+
+def collectGarbage():
+    """
+    Collect garbage now - in realtime mode, call this in null periods only.
+    """
+    if _REALTIME_STATE is None:
+        return 0
+    tStart = time.perf_counter()
+    n = gc.collect(1)  # the young generations - the rest is frozen
+    _REALTIME_STATE['gcTime'] = _REALTIME_STATE.get('gcTime', 0.0) + time.perf_counter() - tStart
+    return n
+
+
+def leaveRealtime():
+    """
+    Undo enterRealtime() (called by endExperiment, and at exit).
+    """
+    global _REALTIME_STATE
+    state = _REALTIME_STATE
+    if state is None:
+        return
+    _REALTIME_STATE = None
+    gc.enable()
+    gc.unfreeze()
+    if 'libc' in state:
+        state['libc'].munlockall()
+    if 'scheduler' in state:
+        policy, param = state['scheduler']
+        try:
+            os.sched_setscheduler(0, policy, param)
+        except OSError:
+            pass
+    if state.get('rush'):
+        core.rush(False)
+    if 'nice' in state:
+        try:
+            os.nice(state['nice'] - os.nice(0))
+        except OSError:
+            pass
+    if 'affinity' in state:
+        os.sched_setaffinity(0, state['affinity'])
+    print(f"(compatibility) realtime off. garbage collection in null periods: "
+          f"{state.get('gcTime', 0.0)*1000:.1f} ms")
+
+
 def waitForScanner(myWin, fixation=None, method='digital'):
     """
     Wait for the scanner to start.
+
+    Registered stimuli (registerStim) are warmed up first, behind the message.
+    With REALTIME, realtime mode (enterRealtime) is on from the end of the
+    warm-up, so it is in place when this returns at the trigger.
     """
     # @TODO make sure it works with VPIXX trigger (not 5!)
     # create text stimuli
@@ -179,31 +520,39 @@ def waitForScanner(myWin, fixation=None, method='digital'):
     message1.draw()
     message2.draw()
     myWin.flip()
+
+    # the message stays up (front buffer) while stimuli are drawn behind it
+    warmUp(myWin)
+    if method == 'digital' and not (HEADLESS and not SIMULATE):
+        # start the DIN reader / clock sync threads before realtime mode, so
+        # they don't inherit the frame loop's SCHED_FIFO and CPU
+        getDinReader()
+    if REALTIME:
+        # before the trigger, so locking memory etc. doesn't delay the first frame
+        enterRealtime()
     
     #This requires button to be pushed before anything triggers I'd argue we don't want that? DM - 07/01/2026
 #    event.waitKeys()
 
-    if method == 'digital':
-
-        #connect to VPixx device
-        device = PROPixxCTRL()   #if you have a datapixx3 change this to “device = DATAPixx3”
+    if HEADLESS and not SIMULATE:
+        # nothing to wait for - start straight away
+        print("(compatibility) headless: not waiting for scanner")
+        t1 = core.getTime()
+        return t1, 0.0
 
-        myLog = device.din.setDinLog(12e6, 1000)
-        device.din.startDinLog()
-        device.updateRegisterCache()
-        startTime = device.getTime()
+    if method == 'digital':
 
-        #let's create a loop which checks the schedule for triggers.
-        #Any time a trigger is detected, we print the timestamp and DIN state.
+        # the DIN log is read in the background (and keeps running after the
+        # trigger, for button presses) - here we only look at the queue
+        reader = getDinReader()
+        reader.drain()  # anything from before we started waiting is stale
+        reader.markRun()  # count scanner pulses from here on
 
         print('(checkDIO) waiting for scanner')
         t0 = core.getTime()
         kwait = 1
         while kwait:
-            #read device status
-            device.updateRegisterCache()
-            device.din.getDinLogStatus(myLog)
-            newEvents = myLog["newLogFrames"]
+            triggers, presses = splitDinEvents(reader.drain())
 
             for key in event.getKeys():
                 if key in ['5', 't']:
@@ -215,18 +564,16 @@ def waitForScanner(myWin, fixation=None, method='digital'):
                     myWin.close()
                     core.quit()
 
-            if newEvents > 0:
-                t1 = core.getTime()
-                eventList = device.din.readDinLog(myLog, newEvents)
-
-                for x in eventList:
+            if len(triggers) > 0:
+                # when the pulse arrived, rather than when it was read
+                t1 = float(getClockSync().toHost(triggers['time'][0]))
+                for x in triggers:
                     print(x)
                 kwait = 0 # break
                 print("-- got trigger via VPIXX!")
+            elif kwait:
+                time.sleep(DIN_POLL_INTERVAL/2)
 
-        #Stop logging
-        device.din.stopDinLog()
-        device.updateRegisterCache()
         return t1, t1-t0
 
     else:
@@ -246,143 +593,280 @@ def waitForScanner(myWin, fixation=None, method='digital'):
                     core.quit()
         return t1, t1-t0
 
+# one connection to the VPixx device, and one DIN log reader, per process
+_DEVICE_SESSION = None
+_DIN_READER = None
+_CLOCK_SYNC = None
+
+
+def getDeviceSession():
+    """
+    The process-wide DeviceSession, connected on first use.
+    """
+    global _DEVICE_SESSION
+    if _DEVICE_SESSION is None:
+        _DEVICE_SESSION = DeviceSession()
+    return _DEVICE_SESSION
+
+
+def openDeviceSession(device):
+    """
+    Use this device (e.g. a configured simulatedPixx.PROPixxCTRL) for the
+    process-wide session. Call before anything talks to the device.
+    """
+    global _DEVICE_SESSION
+    if _DEVICE_SESSION is not None or _DIN_READER is not None:
+        raise RuntimeError("(compatibility) device session already open")
+    _DEVICE_SESSION = DeviceSession(device)
+    return _DEVICE_SESSION
+
+
+def getDinReader():
+    """
+    The process-wide DinLogReader, started on first use.
+    """
+    global _DIN_READER
+    if _DIN_READER is None:
+        _DIN_READER = DinLogReader()
+        _DIN_READER.start()
+        atexit.register(_DIN_READER.stop)  # stop logging, even on core.quit()
+        getClockSync()  # so DIN event times can be put on the host clock
+    return _DIN_READER
+
+
+def getClockSync():
+    """
+    The process-wide ClockSync, started on first use.
+    """
+    global _CLOCK_SYNC
+    if _CLOCK_SYNC is None:
+        _CLOCK_SYNC = ClockSync()
+        _CLOCK_SYNC.start()
+        atexit.register(_CLOCK_SYNC.stop)
+    return _CLOCK_SYNC
+
+
+def splitDinEvents(events):
+    """
+    Split DIN events into (scanner triggers, button presses).
+
+    Presses are the ResponsePixx codes, minus button releases.
+    """
+    isButton = np.isin(events['value'], list(PIXX_BUTTON_CODES))
+    isPress = isButton & (events['value'] != 64512)
+    return events[~isButton], events[isPress]
+
+
+def getKeys():
+    """
+    event.getKeys(), plus any ResponsePixx presses since the last call.
+
+    Presses come from the background DIN reader (if it is running), as the
+    keys in PIXX_BUTTON_KEYS. Scanner triggers after the first are dropped.
+    """
+    keys = event.getKeys()
+    if _DIN_READER is not None:
+        triggers, presses = splitDinEvents(_DIN_READER.drain())
+        for value in presses['value']:
+            key = PIXX_BUTTON_KEYS.get(PIXX_BUTTON_CODES[value])
+            if key is not None:
+                keys.append(key)
+    return keys
+
+
+def markNextFlip(value):
+    """
+    Put a marker on the DOUT (MARKER_MASK bits) when the next flip is shown.
+
+    Queued here, and sent by writeFrameMarkers() just before the flip, for
+    the device to write at the next vertical sync. The marker is cleared
+    (at the sync after that) unless the next frame is marked too.
+    """
+    if HEADLESS and not SIMULATE:
+        return
+    getDeviceSession().queueMarker(value, MARKER_MASK)
+
+
+def writeFrameMarkers():
+    """
+    Send the markers queued for this frame. Call right before myWin.flip();
+    doesn't wait for the sync, and returns straight away (without taking
+    the session lock) on frames without markers.
+    """
+    if _DEVICE_SESSION is not None:
+        _DEVICE_SESSION.writeMarkers()
+
+
 # Starting to add in Michaels parallel port output triggers - DM 07/01/2026
 
-def set_all_pins(state):
+def set_all_pins(state, flush=True):
     """
     Set all pins to the specified state (1 = HIGH, 0 = LOW).
     - state: 1 for HIGH (ON), 0 for LOW (OFF).
+    - flush: send now; if False, the write goes out with the next
+      DeviceSession.update() (e.g. the DIN reader's next poll).
     """
-            #connect to VPixx device
-    device = PROPixxCTRL()   #if you have a datapixx3 change this to “device = DATAPixx3”
-    
-    myLog = device.din.setDinLog(12e6, 1000)
-    device.din.startDinLog()
-    device.updateRegisterCache()
-    startTime = device.getTime()
+    session = getDeviceSession()
     bit_mask = 0xFFFFFF  # Mask for all 24 pins (bits)
     bit_value = 0xFFFFFF if state == 1 else 0x000000  # Set all bits HIGH or LOW
-    device.dout.setBitValue(bit_value, bit_mask)
-    device.updateRegisterCache()
+    session.setBits(bit_value, bit_mask)
+    if flush:
+        session.update()
 
-def set_pin(pin, state):
+def set_pin(pin, state, flush=True):
     """
     Set a specific pin (bit) to HIGH (1) or LOW (0).
     - pin: The bit position (e.g., 0 for Pin 2, 1 for Pin 3, etc.).
     - state: 1 to turn ON, 0 to turn OFF.
+    - flush: send now; if False, the write goes out with the next
+      DeviceSession.update() (e.g. the DIN reader's next poll).
     """
-    device = PROPixxCTRL()   #if you have a datapixx3 change this to “device = DATAPixx3”
-    
-    myLog = device.din.setDinLog(12e6, 1000)
-    device.din.startDinLog()
-    device.updateRegisterCache()
-    startTime = device.getTime()
+    session = getDeviceSession()
     bit_mask = 1 << pin  # Create a mask for the specific pin
     bit_value = state << pin  # Set the desired state for the specific pin
-    device.dout.setBitValue(bit_value, bit_mask)
-    device.updateRegisterCache()
-
-def fixationTask(myWin, fixationInfo, targTime=None, targFlag=None, trialClock=None):
-    """
-    Function that checks keyboard presses, etc.
-    Encapulates the task of checking for key presses and updating the fixation information.
-    """
-    # set locally
-    nTargsH, nTargsC, nTargsF = 0, 0, 0
-    # loop through all keys
-    for key in event.getKeys():
-        keyTime = trialClock.getTime()
-        if key in ['escape', 'q']:
-            print(myWin.fps())
-            myWin.close()
-            core.quit()
-        elif key in BUTTON_CODES:
-            if targFlag:
-                # if there was a target and a response
-                # HIT
-                if (keyTime-targTime) < 1:  # if within 1s
-                    nTargsC = nTargsC+1
-                    nTargsH = nTargsH+1
-                    targFlag = 0
-            else:
-                # if there was no target but a response
-                # FALSE ALARM
-                nTargsC = nTargsC-1
-                nTargsF = nTargsF+1
-
-    # store away C, H
-    # fixationInfo['nTargs'] += nTargs
-    fixationInfo['nTargsH'] += nTargsH
-    fixationInfo['nTargsC'] += nTargsC
-    fixationInfo['nTargsF'] += nTargsF
-
-    return fixationInfo
-
-
-def pickFixationColor(fixationInfo, trialClock=None, t_p=None, fixation=None):
-    # get a local color_key
-    color_key = fixationInfo['color_key']
-    fn = fixationInfo['fn']
-    my_colors = fixationInfo['my_colors']
-    fixLength = fixationInfo['fixLength']
-    nTargs = 0
-    targFlag = 0
-    targTime = 0
-
-    # get the time
-    t = trialClock.getTime()
-    t_diff = t-t_p
-    if t_diff > fixLength:
-        old_color_key = color_key
-        fnPrev = fn
-        while color_key == old_color_key:
-            fn = np.random.randint(len(my_colors.keys()))
-            color_key = list(my_colors.keys())[fn]
-        this_color = my_colors[color_key]
-        fixation.setColor(this_color)
-        if fn == 3:  # target
-            nTargs = nTargs + 1
-            targTime = trialClock.getTime()
-            targFlag = 1
-
-        t_p = t  # reset the time
-
-    return targTime, targFlag
-
-
-def showNullPeriod(myWin, fixation, fixationInfo, nullPeriod):
+    session.setBits(bit_value, bit_mask)
+    if flush:
+        session.update()
+
+def showNullPeriod(myWin, fixation, task, nullPeriod, recorder=None, t0=None,
+                   journal=None):
     """
     Show the null period before the experiment starts.
-    """
-    # loop
-    # t = lastFPSupdate = 0
-    t_p = 0
-    trialClock = core.Clock()
 
-    targFlag = 0
-    targTime = 0
+    task is a FixationTask, run on times since t0 (default: now). If a
+    FrameRecorder is passed in, every flip is recorded (state -1); if a
+    FrameJournal is, every flip goes in it too (stim 0, as blank blocks),
+    with the button presses and quit key.
+    """
+    t0 = core.getTime() if t0 is None else t0
+    collectGarbage()  # nothing on screen changes much now (realtime mode)
 
     # for the duration of the null period
-    while trialClock.getTime() < nullPeriod:
-
-        targTime, targFlag = pickFixationColor(
-            fixationInfo, trialClock, t_p, fixation)
-
+    frameN = 0
+    t = core.getTime() - t0
+    while t < nullPeriod:
+        task.update(t, fixation)
         fixation.draw()
 
         myWin.flip()
-
-        # function that checks keyboard presses, etc.
-        fixationInfo = fixationTask(
-            myWin, fixationInfo, targTime, targFlag, trialClock)
-
-    return fixationInfo
+        if recorder is not None:
+            recorder.record(frameN, -1)
+        if journal is not None:
+            journal.record(frameN, 0, fixColor=task.colorIndex())
+        frameN += 1
+
+        for key in getKeys():
+            if key in ['escape', 'q']:
+                if journal is not None:
+                    journal.flagResponse(RESPONSE_KEY_QUIT)
+                print(myWin.fps())
+                myWin.close()
+                core.quit()
+            elif key in BUTTON_CODES:
+                task.respond(core.getTime() - t0)
+                if journal is not None:
+                    journal.flagResponse(RESPONSE_BUTTON)
+        t = core.getTime() - t0
+
+    return task
+
+
+def reportFrameStats(myWin):
+    """
+    Print frame-time statistics from the window's recorded frame intervals.
+    """
+    intervals = np.array(myWin.frameIntervals)
+    if len(intervals) < 2:
+        print("(compatibility) no frame intervals recorded")
+        return None
+    stats = {'nFrames': len(intervals),
+             'mean': intervals.mean(),
+             'sd': intervals.std(),
+             'median': np.median(intervals),
+             'p99': np.percentile(intervals, 99),
+             'max': intervals.max()}
+    print('%%%%%%%%%%%%%%%%%')
+    print(f"frames: {stats['nFrames']}, frame time (ms): "
+          f"mean {stats['mean']*1000:.2f}, sd {stats['sd']*1000:.2f}, "
+          f"median {stats['median']*1000:.2f}, 99% {stats['p99']*1000:.2f}, "
+          f"max {stats['max']*1000:.2f}")
+    print('%%%%%%%%%%%%%%%%%')
+    return stats
+
+
+def checkVolumes(pulses, tr=None, tEnd=None, clockSync=None):
+    """
+    Compare the scanner pulses of a run with the expected TR grid.
+
+    pulses come from DinLogReader.pulses(). Each pulse is put in the nearest
+    TR slot after the first one: empty slots are missing volumes, slots with
+    more than one pulse have extra pulses. The effective TR is fitted on the
+    device clock, and the drift is how far the host (stimulus) clock moved
+    against the device (scanner) clock over the run. The drift rate comes
+    from clockSync (a ClockSync, fitted on the midpoints of timed register
+    reads) if given; otherwise it is fitted on the host times the pulses
+    were read at, which lag the pulses by up to a poll interval, so short
+    runs get a noisy estimate. If tEnd (host time at the end of the
+    stimulus) is given, volumes expected after the last pulse count as
+    missing too. tr defaults to the median pulse interval.
+    """
+    if len(pulses) < 2:
+        print(f"(compatibility) {len(pulses)} scanner pulses - nothing to check")
+        return None
+    t = pulses['time'] - pulses['time'][0]
+    if tr is None:
+        tr = np.median(np.diff(t))
+    slots = np.round(t/tr).astype(int)
+    nSlots = slots[-1] + 1
+    nFilled = len(np.unique(slots))
+    missingSlots = np.setdiff1d(np.arange(nSlots), slots)
+    nTrailing = 0
+    if tEnd is not None:
+        nTrailing = max(int((tEnd - pulses['host'][0])/tr + 1e-6) + 1 - nSlots, 0)
+    effectiveTR = np.polyfit(slots, t, 1)[0]
+    if clockSync is not None:
+        hostRate = clockSync.toHost(1.0) - clockSync.toHost(0.0)
+    else:
+        hostRate = np.polyfit(t, pulses['host'] - pulses['host'][0], 1)[0]
+    drift = (hostRate - 1.0)*t[-1]
+
+    print('%%%%%%%%%%%%%%%%%')
+    print(f"scanner pulses: {len(pulses)}, volumes: {nSlots} (TR {tr:.4f} s)")
+    print(f"missing: {len(missingSlots) + nTrailing}"
+          + (f" (at volumes {np.array2string(missingSlots, threshold=8)})" if len(missingSlots) else "")
+          + (f" ({nTrailing} after the last pulse)" if nTrailing else "")
+          + f", extra: {len(pulses) - nFilled}")
+    print(f"effective TR: {effectiveTR:.5f} s, stimulus-scanner drift: "
+          f"{drift*1000:.2f} ms over {t[-1]:.1f} s")
+    print('%%%%%%%%%%%%%%%%%')
+    return {'nPulses': len(pulses), 'nVolumes': nSlots,
+            'missing': missingSlots, 'nTrailing': nTrailing,
+            'nExtra': len(pulses) - nFilled, 'effectiveTR': effectiveTR,
+            'drift': drift}
+
+
+def reportVolumes(tr=None):
+    """
+    checkVolumes() on the pulses of this run, if the DIN reader was running.
+    """
+    if _DIN_READER is None:
+        return None
+    tr = SCANNER_TR if tr is None else tr
+    return checkVolumes(_DIN_READER.pulses(), tr, core.getTime(), _CLOCK_SYNC)
 
 
 def endExperiment(myWin):
     """
     End the experiment and show a thank you message.
+
+    Reports the scanner volumes counted during the run (see checkVolumes).
+    In headless mode, report frame-time statistics instead of waiting for a key.
     """
+    leaveRealtime()
+    reportVolumes()
+    if HEADLESS:
+        reportFrameStats(myWin)
+        return
     # create text stimuli
     message1 = visual.TextStim(myWin, pos=[
                                0, +.5], wrapWidth=1.5, color='#000000', alignText='center', name='topMsg', text="aaa", units='norm')
@@ -406,6 +890,760 @@ def getTimeStr():
     return time.strftime("%Y-%m-%dT%H%M%S", time.localtime())
 
 
+def _frameRateCacheKey(myWin):
+    # anything that changes the refresh rate: host, monitor, mode, backend
+    key = {'host': platform.node(),
+           'monitor': getattr(myWin.monitor, 'name', str(myWin.monitor)),
+           'screen': getattr(myWin, 'screen', 0),
+           'size': [int(x) for x in myWin.size],
+           'fullscr': bool(getattr(myWin, '_isFullScr', False)),
+           'winType': myWin.winType}
+    try:
+        # refresh rate of the current video mode, as the OS reports it
+        key['modeRate'] = myWin.winHandle.screen.get_mode().rate
+    except Exception:
+        key['modeRate'] = None
+    return key
+
+
+def measureFrameRate(myWin, default=DEFAULT_FRAME_RATE):
+    """
+    Refresh rate of the window (Hz), measured once per display setup.
+
+    Measurements are cached (framerate.json in CACHE_DIR) per host, monitor,
+    screen, resolution, fullscreen and backend (see _frameRateCacheKey), so
+    later launches on the same setup don't spend time measuring. Set
+    MRIVIS_REMEASURE_FRAME_RATE=1 to measure again. Falls back on the default
+    if psychopy can't get a stable measurement (not cached). Headless
+    windows don't sync to a display, so they use the default.
+    """
+    if HEADLESS:
+        print(f"(compatibility) headless: assuming {default} Hz")
+        return default
+    key = _frameRateCacheKey(myWin)
+    keyStr = json.dumps(key, sort_keys=True)
+    cache = _readCache('framerate.json')
+    entry = cache.get(keyStr)
+    if entry and not REMEASURE_FRAME_RATE:
+        print(f"(compatibility) frame rate: {entry['frameRate']:.3f} Hz "
+              f"(cached, measured {entry['measured']})")
+        return entry['frameRate']
+
+    # only done once per setup, so take a longer measurement than before
+    frameRate = myWin.getActualFrameRate(nIdentical=60, nMaxFrames=600,
+                                         nWarmUpFrames=30)
+    if frameRate is None:
+        print(
+            f"(compatibility) could not measure frame rate. assuming {default} Hz")
+        return default
+    cache[keyStr] = {'frameRate': frameRate, 'measured': getTimeStr()}
+    _writeCache('framerate.json', cache)
+    print(f"(compatibility) frame rate: {frameRate:.3f} Hz (measured, cached)")
+    return frameRate
+
+
+def compileSchedule(blocks, frameRate, flashPeriod=0.25, fixLength=None):
+    """
+    Compile a list of (stimId, duration) blocks into a per-frame schedule.
+
+    Frame i is shown at i/frameRate after the scanner trigger, so block
+    onsets are fixed to the trigger and don't drift over a run. Polarity
+    flips every half flashPeriod (restarting at each block onset) and the
+    fixation field counts fixLength periods since the trigger.
+    Returns a structured array (SCHEDULE_DTYPE) with one entry per frame.
+    """
+    stimIds = np.array([stimId for (stimId, _) in blocks], dtype=int)
+    durations = np.array([duration for (_, duration) in blocks], dtype=float)
+    onsets = np.concatenate([[0], np.cumsum(durations)])
+    # block onsets rounded to the nearest frame
+    onsetFrames = np.round(onsets*frameRate).astype(int)
+    nFrames = onsetFrames[-1]
+
+    schedule = np.zeros(nFrames, dtype=SCHEDULE_DTYPE)
+    frames = np.arange(nFrames)
+    t = frames/frameRate
+    block = np.searchsorted(onsetFrames, frames, side='right') - 1
+    tBlock = (frames - onsetFrames[block])/frameRate
+
+    schedule['time'] = t
+    schedule['block'] = block
+    schedule['stim'] = stimIds[block]
+    schedule['polarity'] = np.where(
+        (tBlock % flashPeriod) < (flashPeriod/2.0), 1, -1)
+    schedule['polarity'][schedule['stim'] == 0] = 0
+    if fixLength is not None:
+        schedule['fixation'] = np.floor(t/fixLength)
+    return schedule
+
+
+def nextFrame(t, frameRate):
+    """
+    Index into the schedule of the frame after the one shown at time t (s
+    since trigger). Dropped frames are skipped rather than shifting the rest.
+    """
+    return int(t*frameRate + 0.5) + 1
+
+
+def saveRun(filename, taskName, params, t0, schedule=None, frames=None,
+             task=None, stimNames=None, until=None):
+    """
+    Save what a run actually did, for bidsEvents.py: the schedule, the flips
+    (FrameRecorder.frames() or journal records - only time and frame are
+    used), the task responses and score, and the parameters. Times are
+    saved relative to t0 (the trigger). taskName becomes the BIDS task label.
+    """
+    run = {'params': json.dumps(dict(params, task=taskName, savedAt=time.time(),
+                                     psychopyVersion=PSYCHOPY_VERSION),
+                                default=str),
+           'stimNames': json.dumps(stimNames or {})}
+    if schedule is not None:
+        run['schedule'] = schedule
+    if frames is not None:
+        run['flipTimes'] = frames['time'] - t0
+        run['flipFrames'] = frames['frame']
+    if task is not None:
+        result = task.score(until)
+        run['responses'] = task.responses[:task.nResponses]
+        run['fixLength'] = task.fixLength
+        run['targetOnsets'] = result['targetOnsets']
+        run['targetHit'] = result['hit']
+        run['targetRT'] = np.full(result['nTargs'], np.nan)
+        run['targetRT'][result['hit']] = result['rt']
+        run['score'] = json.dumps({key: result[key] for key in
+                                   ['nTargs', 'nTargsH', 'nTargsF', 'nTargsC',
+                                    'score', 'meanRT', 'seed']}, default=float)
+    np.savez(filename, **run)
+    print(f"(compatibility) saved run record to {filename}")
+
+
+class FrameRecorder:
+    """
+    Record a timestamp, frame index and state code for every flip.
+
+    Entries go into a preallocated ring buffer (FRAME_DTYPE), so record()
+    doesn't allocate anything in the frame loop. At the end of the run,
+    summary() reports dropped frames and save() writes the buffer to disk.
+    """
+
+    def __init__(self, frameRate=DEFAULT_FRAME_RATE, size=2**17):
+        self.buffer = np.zeros(size, dtype=FRAME_DTYPE)
+        # field views, so record() is three scalar writes
+        self._time = self.buffer['time']
+        self._frame = self.buffer['frame']
+        self._state = self.buffer['state']
+        self.size = size
+        self.nRecorded = 0
+        self.framePeriod = 1.0/frameRate
+        self.t0 = None
+
+    def setAnchor(self, t0):
+        # times in the summary are reported relative to this (e.g. trigger)
+        self.t0 = t0
+
+    def record(self, frame=-1, state=0, t=None):
+        k = self.nRecorded % self.size
+        self._time[k] = core.getTime() if t is None else t
+        self._frame[k] = frame
+        self._state[k] = state
+        self.nRecorded += 1
+
+    def frames(self):
+        """
+        Recorded entries in order, oldest first.
+        """
+        if self.nRecorded <= self.size:
+            return self.buffer[:self.nRecorded]
+        k = self.nRecorded % self.size
+        return np.concatenate([self.buffer[k:], self.buffer[:k]])
+
+    def summary(self):
+        """
+        Print (and return) dropped frames, worst interval and where drops happened.
+        """
+        frames = self.frames()
+        if len(frames) < 2:
+            print("(compatibility) not enough frames recorded")
+            return None
+        t0 = frames['time'][0] if self.t0 is None else self.t0
+        intervals = np.diff(frames['time'])
+        dropped = intervals > 1.5*self.framePeriod
+        # a long interval can hide more than one missed refresh
+        nDropped = int(np.sum(np.round(intervals[dropped]/self.framePeriod) - 1))
+        worst = np.argmax(intervals)
+        # attribute each drop to the frame that came late
+        late = frames[1:][dropped]
+        states, counts = np.unique(late['state'], return_counts=True)
+
+        print('%%%%%%%%%%%%%%%%%')
+        print(f"frames: {len(frames)}, dropped: {nDropped} "
+              f"(in {np.sum(dropped)} late flips)")
+        print(f"interval: mean {intervals.mean()*1000:.2f} ms, "
+              f"jitter (sd) {intervals.std()*1000:.3f} ms, "
+              f"worst {intervals[worst]*1000:.2f} ms "
+              f"at t={frames['time'][worst+1]-t0:.3f} s "
+              f"(frame {frames['frame'][worst+1]}, state {frames['state'][worst+1]})")
+        for state, count in zip(states, counts):
+            times = late['time'][late['state'] == state] - t0
+            print(f"  state {state}: {count} late flips, "
+                  f"t={np.array2string(times, precision=2, threshold=8)}")
+        print('%%%%%%%%%%%%%%%%%')
+        return {'nFrames': len(frames), 'nDropped': nDropped,
+                'jitter': intervals.std(), 'worstInterval': intervals[worst],
+                'dropTimes': late['time'] - t0,
+                'dropFrames': late['frame'], 'dropStates': late['state']}
+
+    def save(self, filename):
+        np.save(filename, self.frames())
+        print(f"(compatibility) saved frame times to {filename}")
+
+
+class FlipPredictor:
+    """
+    Predict when the next flip will be shown, so stimuli can be evaluated
+    for that time instead of the time they are drawn (a refresh early).
+
+    predict() extrapolates from the last flip by whole refresh periods;
+    flipped() takes the measured flip time and stores how far the
+    prediction was off, in a preallocated array. report() summarises.
+    """
+
+    def __init__(self, frameRate=DEFAULT_FRAME_RATE, size=2**17):
+        self.period = 1.0/frameRate
+        self.lastFlip = None
+        self.predicted = None
+        self.errors = np.zeros(size)
+        self.size = size
+        self.nFlips = 0
+
+    def predict(self, now=None):
+        now = core.getTime() if now is None else now
+        if self.lastFlip is None:
+            self.predicted = now + self.period
+        else:
+            # the first refresh after now (at least one after the last flip)
+            n = max(1, int(np.ceil((now - self.lastFlip)/self.period)))
+            self.predicted = self.lastFlip + n*self.period
+        return self.predicted
+
+    def flipped(self, t=None, predicted=None):
+        t = core.getTime() if t is None else t
+        predicted = self.predicted if predicted is None else predicted
+        if predicted is not None and self.nFlips < self.size:
+            self.errors[self.nFlips] = t - predicted
+            self.nFlips += 1
+        self.lastFlip = t
+        self.predicted = None
+
+    def report(self):
+        """
+        Print (and return) the flip prediction errors.
+        """
+        errors = self.errors[:self.nFlips]
+        if not len(errors):
+            return None
+        # the median is the fixed lag from flip to timestamp; the rest is jitter
+        bias = np.median(errors)
+        jitter = errors - bias
+        nMissed = int(np.sum(np.abs(jitter) > self.period/2))
+        print('%%%%%%%%%%%%%%%%%')
+        print(f"flip prediction: median error {bias*1000:.2f} ms, "
+              f"sd {jitter.std()*1000:.2f} ms, worst {np.abs(jitter).max()*1000:.2f} ms, "
+              f"{nMissed} of {len(errors)} off by more than half a refresh")
+        print('%%%%%%%%%%%%%%%%%')
+        return {'bias': bias, 'sd': jitter.std(), 'worst': np.abs(jitter).max(),
+                'nMissed': nMissed, 'nFlips': len(errors)}
+
+
+class DeviceSession:
+    """
+    A single PROPixxCTRL connection, shared by everything in the process.
+
+    Every register-cache round trip goes through update(), under a lock, so
+    the DIN reader thread and the pin functions can share the device. DOUT
+    writes are queued with setBits() and go out with the next update(),
+    which also refreshes the DIN registers - one USB round trip for both.
+
+    Frame markers (queueMarker / writeMarkers) are written by the device at
+    the next vertical sync instead. No other register write may go out
+    before that sync, or it would send the marker early: the background
+    threads call waitForSync() first, which sleeps without the lock until
+    the sync is due, and update() only waits for the sync itself (under the
+    lock) if it is called before then.
+    """
+
+    def __init__(self, device=None):
+        self.device = deviceClass()() if device is None else device
+        self.lock = threading.RLock()
+        self._doutValue = 0
+        self._doutMask = 0
+        self.nUpdates = 0
+        self._markerValue = 0
+        self._markerMask = 0
+        self._markerOn = 0  # marker bits set at the last sync, to clear
+        self._videoSyncPending = False
+        self._syncDue = 0.0  # core.getTime() by which the pending sync has passed
+        self._videoSyncCalls = None
+
+    def _videoSync(self):
+        # (write, update) the register cache at the next vertical sync
+        if self._videoSyncCalls is None:
+            if hasattr(self.device, 'writeRegCacheAfterVideoSync'):  # simulatedPixx
+                self._videoSyncCalls = (self.device.writeRegCacheAfterVideoSync,
+                                        self.device.updateRegCacheAfterVideoSync)
+            else:
+                from pypixxlib import _libdpx
+                self._videoSyncCalls = (_libdpx.DPxWriteRegCacheAfterVideoSync,
+                                        _libdpx.DPxUpdateRegCacheAfterVideoSync)
+        return self._videoSyncCalls
+
+    def queueMarker(self, value, mask):
+        with self.lock:
+            self._markerValue = (self._markerValue & ~mask) | (value & mask)
+            self._markerMask |= mask
+
+    def writeMarkers(self):
+        """
+        Have the device write queued markers (and clear last frame's) at the next sync.
+        """
+        # called every frame by the render loop: most frames have nothing to
+        # write, and those must not wait for the lock (only this thread and
+        # queueMarker, on the same thread, change these)
+        if not (self._markerMask or self._markerOn):
+            return
+        with self.lock:
+            if not (self._markerMask or self._markerOn):
+                return
+            mask = self._markerMask | self._markerOn
+            # anything else queued for the DOUT goes out with the markers
+            value = (self._doutValue & ~mask) | (self._markerValue & mask)
+            self.device.dout.setBitValue(value, mask | self._doutMask)
+            self._videoSync()[0]()
+            self._syncDue = core.getTime() + MARKER_SYNC_WAIT
+            self._markerOn = self._markerValue & self._markerMask
+            self._markerValue = 0
+            self._markerMask = 0
+            self._doutValue = 0
+            self._doutMask = 0
+            self._videoSyncPending = True
+            self.nUpdates += 1
+
+    def setBits(self, value, mask):
+        # later writes to the same bits win
+        with self.lock:
+            self._doutValue = (self._doutValue & ~mask) | (value & mask)
+            self._doutMask |= mask
+
+    def waitForSync(self):
+        """
+        Sleep, without the lock, until a pending marker's sync has passed.
+
+        For the background threads, before they take the lock for update():
+        otherwise they would hold it through the sync and the render loop
+        could block on it right before a flip.
+        """
+        if self._videoSyncPending:
+            remaining = self._syncDue - core.getTime()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def update(self):
+        """
+        Write queued DOUT bits and refresh the register cache. Returns device time.
+        """
+        with self.lock:
+            if self._doutMask:
+                self.device.dout.setBitValue(self._doutValue, self._doutMask)
+                self._doutValue = 0
+                self._doutMask = 0
+            if self._videoSyncPending and core.getTime() < self._syncDue:
+                # a marker is waiting for the sync - don't write before it
+                self._videoSync()[1]()
+            else:
+                self.device.updateRegisterCache()
+            self._videoSyncPending = False
+            self.nUpdates += 1
+            return self.device.getTime()
+
+
+class ClockSync(threading.Thread):
+    """
+    Linear model between the host clock (core.getTime) and the device clock.
+
+    Every `interval` seconds, a device time is read between two host
+    timestamps; the middle of that round trip is paired with the device
+    time. host = hostRef + slope*(device - deviceRef) is refitted to the
+    last `size` pairs after each sample, using the faster half of the round
+    trips (slow ones have an uncertain midpoint). toHost() / toDevice()
+    convert whole arrays of event times between the two clocks.
+    """
+
+    def __init__(self, session=None, interval=None, size=256):
+        super().__init__(name='ClockSync', daemon=True)
+        self.session = getDeviceSession() if session is None else session
+        self.interval = CLOCK_SYNC_INTERVAL if interval is None else interval
+        self.samples = np.zeros(size, dtype=SYNC_DTYPE)
+        self.size = size
+        self.nSamples = 0
+        self._stopEvent = threading.Event()
+        self._model = (0.0, 0.0, 1.0)  # deviceRef, hostRef, slope
+        # one pair straight away, so conversions work from the start
+        self.sample()
+
+    def sample(self):
+        self.session.waitForSync()
+        with self.session.lock:
+            h0 = core.getTime()
+            device = self.session.update()
+            h1 = core.getTime()
+        self.samples[self.nSamples % self.size] = (0.5*(h0 + h1), device, h1 - h0)
+        self.nSamples += 1
+        self._fit()
+
+    def _fit(self):
+        samples = self.samples[:min(self.nSamples, self.size)]
+        samples = samples[samples['roundTrip'] <= np.median(samples['roundTrip'])]
+        deviceRef = samples['device'].mean()
+        hostRef = samples['host'].mean()
+        slope = 1.0
+        if len(samples) > 2 and np.ptp(samples['device']) > 0:
+            slope = np.polyfit(samples['device'] - deviceRef,
+                               samples['host'] - hostRef, 1)[0]
+        # one assignment, so the other threads never see a half-updated model
+        self._model = (deviceRef, hostRef, slope)
+
+    def run(self):
+        _normalThread()
+        while not self._stopEvent.wait(self.interval):
+            self.sample()
+
+    def toHost(self, deviceTimes):
+        deviceRef, hostRef, slope = self._model
+        return hostRef + slope*(np.asarray(deviceTimes, dtype=float) - deviceRef)
+
+    def toDevice(self, hostTimes):
+        deviceRef, hostRef, slope = self._model
+        return deviceRef + (np.asarray(hostTimes, dtype=float) - hostRef)/slope
+
+    def residual(self):
+        """
+        sd (s) of the sampled host times around the model.
+        """
+        samples = self.samples[:min(self.nSamples, self.size)]
+        return np.std(samples['host'] - self.toHost(samples['device']))
+
+    def stop(self):
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
+
+
+class DinLogReader(threading.Thread):
+    """
+    Read the PROPixxCTRL DIN log in a background thread.
+
+    The log is polled every `interval` seconds; new events are converted
+    to a structured array (DIN_EVENT_DTYPE) and put on a queue. drain()
+    returns everything queued so far without blocking, so the trigger wait
+    and the frame loops can check for events once per frame.
+    """
+
+    def __init__(self, session=None, interval=None):
+        super().__init__(name='DinLogReader', daemon=True)
+        self.session = getDeviceSession() if session is None else session
+        self.device = self.session.device
+        self.interval = DIN_POLL_INTERVAL if interval is None else interval
+        self.events = queue.Queue()
+        self._stopEvent = threading.Event()
+        self.nEvents = 0
+        # every scanner pulse, preallocated (grows if a run is very long)
+        self._pulses = np.zeros(4096, dtype=DIN_EVENT_DTYPE)
+        self.nPulses = 0
+        self.runStart = 0
+
+        with self.session.lock:
+            self._log = self.device.din.setDinLog(12e6, 1000)
+            self.device.din.startDinLog()
+            self.startTime = self.session.update()
+
+    def run(self):
+        _normalThread()
+        while not self._stopEvent.is_set():
+            self.session.waitForSync()
+            with self.session.lock:
+                # also sends any queued DOUT writes
+                self.session.update()
+                self.device.din.getDinLogStatus(self._log)
+                newEvents = self._log["newLogFrames"]
+                if newEvents > 0:
+                    host = core.getTime()
+                    eventList = self.device.din.readDinLog(self._log, newEvents)
+            if newEvents > 0:
+                events = np.zeros(len(eventList), dtype=DIN_EVENT_DTYPE)
+                events['time'] = [x[0] for x in eventList]
+                events['value'] = [x[1] for x in eventList]
+                events['host'] = host
+                self.nEvents += len(events)
+                self._countPulses(events)
+                self.events.put(events)
+            self._stopEvent.wait(self.interval)
+
+    def _countPulses(self, events):
+        triggers, _ = splitDinEvents(events)
+        n = len(triggers)
+        if self.nPulses + n > len(self._pulses):
+            self._pulses = np.concatenate(
+                [self._pulses, np.zeros(len(self._pulses) + n, dtype=DIN_EVENT_DTYPE)])
+        self._pulses[self.nPulses:self.nPulses + n] = triggers
+        self.nPulses += n
+
+    def markRun(self):
+        # the next pulse is the first of the run
+        self.runStart = self.nPulses
+
+    def pulses(self):
+        """
+        Scanner pulses since markRun() (DIN_EVENT_DTYPE), oldest first.
+        """
+        return self._pulses[self.runStart:self.nPulses].copy()
+
+    def drain(self):
+        """
+        All events read since the last drain(), oldest first (may be empty).
+        """
+        chunks = []
+        while True:
+            try:
+                chunks.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        if not chunks:
+            return np.zeros(0, dtype=DIN_EVENT_DTYPE)
+        return np.concatenate(chunks)
+
+    def stop(self):
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
+        with self.session.lock:
+            self.device.din.stopDinLog()
+            self.session.update()
+
+
+class FrameJournal:
+    """
+    One record per frame (JOURNAL_DTYPE) in a memory-mapped .npy file.
+
+    The file is preallocated, so record() is a handful of writes into
+    mapped memory - no allocation and no system calls in the frame loop.
+    A background thread flushes it to disk every JOURNAL_FLUSH_INTERVAL,
+    and again at exit (core.quit() included). Even if the process dies, the
+    mapped pages are written by the OS; loadJournal() reads back whatever
+    frames were recorded.
+    """
+
+    def __init__(self, filename, size=2**17):
+        self.filename = filename
+        self.data = np.lib.format.open_memmap(filename, mode='w+',
+                                              dtype=JOURNAL_DTYPE, shape=(size,))
+        self.data['time'] = np.nan
+        self.data['fixColor'] = -1
+        self.data.flush()
+        # field views, so record() doesn't index by name each frame
+        self._time = self.data['time']
+        self._frame = self.data['frame']
+        self._stim = self.data['stim']
+        self._ori = self.data['ori']
+        self._phase = self.data['phase']
+        self._fixColor = self.data['fixColor']
+        self._response = self.data['response']
+        self.size = size
+        self.nRecorded = 0
+        self._stopEvent = threading.Event()
+        self._flusher = threading.Thread(target=self._flushLoop,
+                                         name='FrameJournal', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def record(self, frame, stim=0, ori=0.0, phase=0.0, fixColor=-1, t=None):
+        if self.nRecorded >= self.size:
+            return  # full - keep the start of the run
+        k = self.nRecorded
+        self._time[k] = core.getTime() if t is None else t
+        self._frame[k] = frame
+        self._stim[k] = stim
+        self._ori[k] = ori
+        self._phase[k] = phase
+        self._fixColor[k] = fixColor
+        self.nRecorded += 1
+
+    def flagResponse(self, flag=RESPONSE_BUTTON):
+        # on the last recorded frame
+        if self.nRecorded:
+            self._response[min(self.nRecorded, self.size) - 1] |= flag
+
+    def _flushLoop(self):
+        _normalThread()
+        while not self._stopEvent.wait(JOURNAL_FLUSH_INTERVAL):
+            self.data.flush()
+
+    def close(self):
+        if self._stopEvent.is_set():
+            return
+        self._stopEvent.set()
+        self._flusher.join()
+        self.data.flush()
+        print(f"(compatibility) journal: {self.nRecorded} frames in {self.filename}")
+
+
+def loadJournal(filename):
+    """
+    The frames recorded in a FrameJournal file, also after a crash.
+    """
+    data = np.load(filename, mmap_mode='r')
+    return np.array(data[~np.isnan(data['time'])])
+
+
+def fixationSequence(nPeriods, nColors, target, targetRate=0.25, minSpacing=2,
+                     rng=None):
+    """
+    Colour index for each fixation period: no colour twice in a row, targets
+    at about targetRate of the periods and at least minSpacing periods apart.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    minSpacing = max(minSpacing, 2)  # targets can't follow each other
+    # gaps between targets: minSpacing plus a geometric tail, mean 1/targetRate
+    p = min(1.0/max(1.0/targetRate - minSpacing + 1, 1.0), 1.0)
+    gaps = minSpacing - 1 + rng.geometric(p, size=nPeriods)
+    targets = np.cumsum(gaps) - 1
+    targets = targets[targets < nPeriods]
+
+    sequence = np.empty(nPeriods, dtype=np.int8)
+    sequence[targets] = target
+    others = np.array([c for c in range(nColors) if c != target])
+    isTarget = np.zeros(nPeriods, dtype=bool)
+    isTarget[targets] = True
+    previous = -1
+    for n in range(nPeriods):
+        if isTarget[n]:
+            previous = target
+            continue
+        choices = others[others != previous]
+        previous = sequence[n] = choices[rng.integers(len(choices))]
+    return sequence
+
+
+class FixationTask:
+    """
+    Fixation colour task, generated up front from a seed.
+
+    One colour per fixLength period (see fixationSequence). In the frame
+    loop, update() / show() only look up the colour of the current period,
+    and respond() writes a response time into a preallocated array. Hits,
+    false alarms and reaction times are scored at the end (score()), from
+    times relative to the same zero (usually the trigger) throughout.
+    """
+    __slots__ = ('colors', 'colorNames', 'fixLength', 'sequence', 'onsets',
+                 'isTarget', 'responseWindow', 'responses', 'nResponses',
+                 'period', 'seed')
+
+    def __init__(self, duration, fixationInfo=None, seed=None, maxResponses=4096):
+        fixationInfo = FIXATION_INFO if fixationInfo is None else fixationInfo
+        colors = fixationInfo['my_colors']
+        self.colorNames = list(colors)
+        self.colors = np.array([colors[name] for name in self.colorNames], dtype=float)
+        self.fixLength = fixationInfo['fixLength']
+        self.responseWindow = fixationInfo.get('responseWindow', 1.0)
+        target = self.colorNames.index(fixationInfo.get('targetColor', 'yellow'))
+
+        # keep the seed, so the sequence can be regenerated later
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        nPeriods = int(np.ceil(duration/self.fixLength)) + 1
+        self.sequence = fixationSequence(nPeriods, len(self.colorNames), target,
+                                         fixationInfo.get('targetRate', 0.25),
+                                         fixationInfo.get('minSpacing', 2),
+                                         np.random.default_rng(self.seed))
+        self.onsets = np.arange(nPeriods)*self.fixLength
+        self.isTarget = self.sequence == target
+        self.responses = np.zeros(maxResponses)
+        self.nResponses = 0
+        self.period = -1
+
+    def show(self, period, fixation):
+        """
+        Set the fixation colour for this period (if it changed). True on a change.
+        """
+        if period == self.period:
+            return False
+        self.period = period = min(period, len(self.sequence) - 1)
+        fixation.setColor(self.colors[self.sequence[period]])
+        return True
+
+    def update(self, t, fixation):
+        return self.show(int(t // self.fixLength), fixation)
+
+    def respond(self, t):
+        if self.nResponses < len(self.responses):
+            self.responses[self.nResponses] = t
+            self.nResponses += 1
+
+    def score(self, until=None):
+        """
+        Hits, false alarms and reaction times, for targets shown before until (s).
+
+        Same rules as the old per-frame counting: the first press after a
+        target is a hit if it comes within responseWindow of the onset, and
+        is ignored (the target missed) if it comes later. Presses before
+        the first target, or after the most recent target was already hit,
+        are false alarms; further presses after a missed target are ignored.
+        nTargsC (hits minus false alarms, at least 0) and Score (% of
+        targets) are as before.
+        """
+        targetOnsets = self.onsets[self.isTarget]
+        if until is not None:
+            targetOnsets = targetOnsets[targetOnsets < until]
+        responses = self.responses[:self.nResponses]
+        nTargs = len(targetOnsets)
+        if nTargs == 0:
+            # every press is a false alarm, and there is nothing to score
+            return {'nTargs': 0, 'nTargsH': 0, 'nTargsF': len(responses),
+                    'nTargsC': 0, 'score': np.nan, 'targetOnsets': targetOnsets,
+                    'hit': np.zeros(0, dtype=bool), 'rt': np.zeros(0),
+                    'meanRT': np.nan, 'seed': self.seed}
+        # most recent target before each press (presses are in time order)
+        target = np.searchsorted(targetOnsets, responses, side='right') - 1
+        rt = responses - targetOnsets[np.maximum(target, 0)]
+        # only the first press after each target counts for it
+        pressed, first, count = np.unique(target[target >= 0], return_index=True,
+                                          return_counts=True)
+        first += np.count_nonzero(target < 0)
+        isHit = rt[first] < self.responseWindow
+        hitTargets = pressed[isHit]
+        hitRTs = rt[first][isHit]
+        nHits = len(hitTargets)
+        nFalse = int(np.count_nonzero(target < 0) + (count[isHit] - 1).sum())
+        nCorrect = max(nHits - nFalse, 0)
+        return {'nTargs': nTargs, 'nTargsH': nHits, 'nTargsF': nFalse,
+                'nTargsC': nCorrect,
+                'score': 100.0*nCorrect/nTargs if nTargs else np.nan,
+                'targetOnsets': targetOnsets, 'hit': np.isin(np.arange(nTargs), hitTargets),
+                'rt': hitRTs, 'meanRT': hitRTs.mean() if nHits else np.nan,
+                'seed': self.seed}
+
+    def colorIndex(self):
+        # colour shown in the current period (-1 before the first)
+        return int(self.sequence[self.period]) if self.period >= 0 else -1
+
+    def report(self, until=None):
+        result = self.score(until)
+        print("nTargs:", result['nTargs'])
+        print("nTargsH:", result['nTargsH'])
+        print("nTargsF:", result['nTargsF'])
+        print("nTargsC:", result['nTargsC'])
+        print("Score: %.2f" % result['score'])
+        print("mean RT: %.3f s" % result['meanRT'])
+        return result
+
+
 """
 FlickeringAnnulus not implemented / working yet.
 SlidingAnnulus and SlidingWedge are implemented
@@ -472,6 +1710,42 @@ class FlickeringAnnulus:
             thisRing.color = -1*thisRing.color  # toggle the color
 
 
+class SlidingMotion:
+    """
+    Back-and-forth motion as a closed-form function of time.
+
+    rate and changeProb are per frame at frameRate, as the increment*()
+    methods use them. frameRate is a reference rate, not the display's: the
+    stimulus classes leave it at DEFAULT_FRAME_RATE, so their rate and
+    changeProb mean per frame at 60 Hz (speed = rate*60 per second) on
+    every display. The direction reversals (geometric gaps, so on average
+    one every 1/changeProb reference frames) are drawn once from seed, for
+    duration seconds; position(t) is then the displacement at t whatever
+    the actual refresh rate, and the same for every run with the same seed.
+    """
+
+    def __init__(self, rate, changeProb, frameRate=DEFAULT_FRAME_RATE,
+                 duration=3600.0, seed=None):
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        rng = np.random.default_rng(self.seed)
+        self.speed = rate*frameRate  # per second
+        nFlips = 0
+        if changeProb > 0:
+            nFlips = int(changeProb*frameRate*duration*1.5) + 16
+        gaps = rng.geometric(changeProb, nFlips) if nFlips else np.zeros(0, dtype=int)
+        flipTimes = np.cumsum(gaps)/frameRate
+        self.flipTimes = np.concatenate([[0.0], flipTimes[flipTimes < duration]])
+        self._sign = np.where(np.arange(len(self.flipTimes)) % 2 == 0, 1.0, -1.0)
+        # displacement at each reversal
+        self._offset = np.concatenate(
+            [[0.0], np.cumsum(self._sign[:-1]*np.diff(self.flipTimes))])*self.speed
+
+    def position(self, t):
+        k = np.searchsorted(self.flipTimes, t, side='right') - 1
+        k = np.maximum(k, 0)
+        return self._offset[k] + self._sign[k]*self.speed*(t - self.flipTimes[k])
+
+
 class SlidingAnnulus:
     def __init__(self, window,
                  size, pos=[0, 0],
@@ -479,15 +1753,20 @@ class SlidingAnnulus:
                  nRings=4,
                  angularRate=0.1,  # phase shift per frame (NOT degs, height?)
                  changeProb=0.01,  # percentage of frames on which dir changes
-                 angularCycles=12):
+                 angularCycles=12,
+                 nPhases=256,  # number of quantised phase steps in mask cache
+                 useMaskCache=True,
+                 seed=None):  # direction changes for setTime (SlidingMotion)
         self.rings = []
         self.ringWidth = dutyCycle/nRings
         self.angularRate = angularRate
         self.changeProb = changeProb
+        self.motion = SlidingMotion(angularRate, changeProb, seed=seed)
         self.nRings = nRings
         self.pos = pos
         self.size = size
         self.radialPhase = 0
+        self.nPhases = nPhases
         self._oneCycle = np.arange(0, 1.0, 1/128.0)
         self._oneCycle = np.where(self._oneCycle <= self.ringWidth, 1, 0)
         for n in range(nRings):
@@ -502,6 +1781,65 @@ class SlidingAnnulus:
                                          )
             self.rings.append(thisRing)
 
+        # all rings use the same family of masks (offset by n*ringWidth), so
+        # one table of nPhases textures serves every ring. the cache owns
+        # those; each ring gets its own texture back before it is deleted
+        self._maskIDs = None
+        self._ownMaskIDs = [ring._maskID for ring in self.rings]
+        self._ringOffsets = np.round(
+            np.arange(nRings)*self.ringWidth*nPhases).astype(int)
+        if useMaskCache:
+            self._buildMaskCache()
+
+    def _ringMask(self, start):
+        # 64 samples of _oneCycle (on where index/128 <= ringWidth)
+        theseIndices = np.arange(start, start+1.001, 1/63.0) % 1.0
+        theseIndices = (theseIndices*128).astype(np.uint8)
+        return np.where(theseIndices/128.0 <= self.ringWidth, 1, 0)
+
+    def ringMasks(self, phase):
+        """
+        The (nRings, 64) radial masks the rings show at this phase.
+        """
+        return np.array([self._ringMask(phase + n*self.ringWidth)
+                         for n in range(self.nRings)])
+
+    def _buildMaskCache(self):
+        """
+        Upload one mask texture per quantised phase step, once.
+
+        Uses the first ring to do the upload (RadialStim.setMask writes into
+        whatever texture is bound to _maskID), then restores its own texture.
+        """
+        ring = self.rings[0]
+        ownMaskID, ownMask = ring._maskID, ring.mask
+        self._maskIDs = []
+        for k in range(self.nPhases):
+            texID = GL.GLuint()
+            GL.glGenTextures(1, ctypes.byref(texID))
+            ring._maskID = texID
+            ring.setMask(self._ringMask(k/self.nPhases))
+            self._maskIDs.append(texID)
+        ring._maskID = ownMaskID
+        ring.setMask(ownMask)
+
+    def _deleteMaskCache(self):
+        if self._maskIDs is None:
+            return
+        # RadialStim.__del__ deletes whatever _maskID is, so it must be the
+        # ring's own texture again, never one of the shared ones
+        for ring, texID in zip(self.rings, self._ownMaskIDs):
+            ring._maskID = texID
+        for texID in self._maskIDs:
+            GL.glDeleteTextures(1, ctypes.byref(texID))
+        self._maskIDs = None
+
+    def __del__(self):
+        try:
+            self._deleteMaskCache()
+        except (ImportError, ModuleNotFoundError, TypeError, AttributeError):
+            pass  # interpreter shutting down, or no GL context any more
+
     def draw(self):
         for thisRing in self.rings:
             thisRing.draw()
@@ -519,14 +1857,152 @@ class SlidingAnnulus:
             else:
                 ring.setOri(self.angularRate, '-')
 
+    def setTime(self, t):
+        # rotation at time t (s), independent of the frame rate and drops
+        ori = self.motion.position(t)
+        for n, ring in enumerate(self.rings):
+            ring.setOri(ori if n % 2 == 0 else -ori)
+
     def setPhase(self, phase):
         self.radialPhase = phase
+        if self._maskIDs is None:
+            self._setPhaseMasks(phase)
+            return
+        # look up the preloaded texture and swap the binding - no upload
+        k = int(round(phase*self.nPhases))
         for n, thisRing in enumerate(self.rings):
-            thisStart = self.radialPhase+n*self.ringWidth
-            theseIndices = np.arange(thisStart, thisStart+1.001, 1/63.0) % 1.0
-            theseIndices = (theseIndices*128).astype(np.uint8)
-            thisMask = self._oneCycle[theseIndices]
-            thisRing.setMask(thisMask)
+            thisRing._maskID = self._maskIDs[(k+self._ringOffsets[n]) % self.nPhases]
+
+    def _setPhaseMasks(self, phase):
+        # original path: rebuild and upload a new mask for every ring
+        for thisRing, mask in zip(self.rings, self.ringMasks(phase)):
+            thisRing.setMask(mask)
+
+
+class BatchedSlidingAnnulus:
+    """
+    Same stimulus (and API) as SlidingAnnulus, but all rings in one mesh.
+
+    The RadialStim fan is cut into nRadial bands. Each frame we work out
+    which ring covers each band (from the radial phase), switch bands on/off
+    via a two-texel mask and add that ring's rotation as an offset to the
+    angular texture coordinate. That is a couple of small array ops and one
+    draw call, whatever nRings is.
+    """
+
+    def __init__(self, window,
+                 size, pos=[0, 0],
+                 dutyCycle=0.25,
+                 nRings=4,
+                 angularRate=0.1,  # phase shift per frame (NOT degs, height?)
+                 changeProb=0.01,  # percentage of frames on which dir changes
+                 angularCycles=12,
+                 angularRes=180,
+                 nRadial=64,  # radial bands, same as the 64 sample ring masks
+                 seed=None):  # direction changes for setTime (SlidingMotion)
+        self.ringWidth = dutyCycle/nRings
+        self.angularRate = angularRate
+        self.changeProb = changeProb
+        self.motion = SlidingMotion(angularRate, changeProb, seed=seed)
+        self.angularCycles = angularCycles
+        self.nRings = nRings
+        self.nRadial = nRadial
+        self.pos = pos
+        self.size = size
+        self.radialPhase = 0
+
+        # mask texel 0 is off, texel 1 is on (nearest neighbour, no interpolation)
+        self.stim = visual.RadialStim(window, pos=self.pos,
+                                      angularRes=angularRes,
+                                      radialCycles=0, angularCycles=angularCycles,
+                                      size=self.size, texRes=64, mask=np.array([0, 1]),
+                                      )
+        self._buildMesh()
+
+        self._ringOri = np.zeros(nRings)
+        # alternate rings go clockwise / anticlockwise
+        self._ringDir = np.where(np.arange(nRings) % 2 == 0, 1.0, -1.0)
+        self._bandRadius = (np.arange(nRadial) + 0.5)/nRadial
+        self._needUpdate = True
+
+    def _buildMesh(self):
+        # cut each triangle of the RadialStim fan into nRadial quads, keeping
+        # its own rim vertices and angular texture coordinates
+        stim = self.stim
+        tris = np.array(stim.vertices).reshape(-1, 3, 2)
+        texCoords = stim._visibleTexture.reshape(-1, 3, 2)
+        nTri = tris.shape[0]
+        f0 = np.arange(self.nRadial)/self.nRadial
+        f1 = f0 + 1.0/self.nRadial
+        p1, p2 = tris[:, 1, np.newaxis, :], tris[:, 2, np.newaxis, :]
+        inner, outer = f0[np.newaxis, :, np.newaxis], f1[np.newaxis, :, np.newaxis]
+        # two triangles per quad: (in1, out1, out2), (in1, out2, in2)
+        vertices = np.stack([inner*p1, outer*p1, outer*p2,
+                             inner*p1, outer*p2, inner*p2], axis=2)
+        s1 = np.repeat(texCoords[:, 1, np.newaxis, 0], self.nRadial, axis=1)
+        s2 = np.repeat(texCoords[:, 2, np.newaxis, 0], self.nRadial, axis=1)
+        self._sBase = np.stack([s1, s1, s2, s1, s2, s2], axis=2)
+        self._texCoords = np.zeros(
+            (nTri, self.nRadial, 6, 2), dtype=texCoords.dtype)
+        self._texCoords[..., 0] = self._sBase
+        self._texCoords[..., 1] = texCoords[0, 1, 1]  # radial coord is constant
+        self._maskCoords = np.zeros(
+            (nTri, self.nRadial, 6), dtype=stim._visibleMask.dtype)
+
+        # a positive ori turns the stim clockwise. work out which way the
+        # angular texture coordinate runs, so ring rotations can be offsets
+        cross = tris[0, 1, 0]*tris[0, 2, 1] - tris[0, 1, 1]*tris[0, 2, 0]
+        sRises = texCoords[0, 2, 0] > texCoords[0, 1, 0]
+        clockwise = (cross < 0) == sRises
+        self._oriToTex = (-1.0 if clockwise else 1.0)*self.angularCycles/360.0
+
+        stim.vertices = vertices.reshape(-1, 2)
+        stim._visibleTexture = self._texCoords.reshape(-1, 2)
+        stim._visibleMask = self._maskCoords.reshape(-1, 1)
+        stim._nVisible = nTri*self.nRadial*6
+
+    def bandRings(self, phase):
+        """
+        Which ring covers each of the nRadial bands at this phase (nRings: none).
+        """
+        u = (self.ringWidth - phase - self._bandRadius) % 1.0
+        return np.minimum(np.floor(u/self.ringWidth).astype(int), self.nRings)
+
+    def _updateMesh(self):
+        # which ring (if any) covers each radial band at this phase
+        bandRing = self.bandRings(self.radialPhase)
+        bandOn = bandRing < self.nRings
+        bandRing = np.minimum(bandRing, self.nRings-1)
+        bandOffset = self._ringOri[bandRing]*self._oriToTex
+        self._texCoords[..., 0] = self._sBase + \
+            bandOffset[np.newaxis, :, np.newaxis]
+        self._maskCoords[:] = np.where(
+            bandOn, 0.75, 0.25)[np.newaxis, :, np.newaxis]
+        self._needUpdate = False
+
+    def draw(self):
+        if self._needUpdate:
+            self._updateMesh()
+        self.stim.draw()
+
+    def setOri(self, ori):
+        self._ringOri[:] = ori
+        self._needUpdate = True
+
+    def incrementRotation(self):
+        if np.random.random() < self.changeProb:
+            self.angularRate *= (-1)  # flip the direction by negating the rate
+        self._ringOri += self._ringDir*self.angularRate
+        self._needUpdate = True
+
+    def setTime(self, t):
+        # rotation at time t (s), independent of the frame rate and drops
+        self._ringOri[:] = self._ringDir*self.motion.position(t)
+        self._needUpdate = True
+
+    def setPhase(self, phase):
+        self.radialPhase = phase
+        self._needUpdate = True
 
 
 class SlidingWedge:
@@ -536,11 +2012,13 @@ class SlidingWedge:
                  # phase shift per frame (fraction of a cycle)
                  radialRate=0.01,
                  changeProb=0.01,  # percentage of frames on which dir changes
+                 seed=None,  # direction changes for setTime (SlidingMotion)
                  ):
         self.segments = []
         self.segWidth = dutyCycle*360.0/nSegs
         self.radialRate = radialRate
         self.changeProb = changeProb
+        self.motion = SlidingMotion(radialRate, changeProb, seed=seed)
 
         phase = 0
         for n in range(nSegs):
@@ -569,11 +2047,108 @@ class SlidingWedge:
             else:
                 seg.setRadialPhase(self.radialRate, '-')
 
+    def setTime(self, t):
+        # radial phase at time t (s), independent of the frame rate and drops
+        phase = self.motion.position(t)
+        for n, seg in enumerate(self.segments):
+            seg.setRadialPhase(phase if n % 2 == 0 else -phase)
+
     def setMask(self, newmask):
         for thisSeg in self.segments:
             thisSeg._set('mask', newmask)
 
 
+class BatchedSlidingWedge:
+    """
+    Same stimulus (and API) as SlidingWedge, but drawn as a single RadialStim.
+
+    All segments live in one vertex array. The radial phase of each segment is
+    written straight into the stim's texture coordinates, so a frame costs
+    one array update and one draw call, whatever nSegs is.
+    (relies on RadialStim keeping _angles, _visible and _visibleTexture as
+    client-side numpy arrays, as it does in modern psychopy)
+    """
+
+    def __init__(self, window, size, pos,
+                 dutyCycle=0.125,
+                 nSegs=3,
+                 # phase shift per frame (fraction of a cycle)
+                 radialRate=0.01,
+                 changeProb=0.01,  # percentage of frames on which dir changes
+                 radialCycles=6,
+                 seed=None,  # direction changes for setTime (SlidingMotion)
+                 ):
+        self.segWidth = dutyCycle*360.0/nSegs
+        self.radialRate = radialRate
+        self.changeProb = changeProb
+        self.motion = SlidingMotion(radialRate, changeProb, seed=seed)
+        self.nSegs = nSegs
+
+        self.stim = visual.RadialStim(window, pos=pos, angularRes=360,
+                                      radialCycles=radialCycles, angularCycles=0,
+                                      visibleWedge=[0, nSegs*self.segWidth],
+                                      size=size, texRes=64, mask=[1]
+                                      )
+        stim = self.stim
+        angles = stim._angles[stim._visible]
+        triangleWidth = 2*np.pi/stim.angularRes
+        # which segment each visible triangle belongs to (same comparisons as
+        # RadialStim uses for visibleWedge)
+        segStarts = np.arange(nSegs)*self.segWidth*np.pi/180
+        self._triSeg = np.searchsorted(segStarts, angles, side='right') - 1
+        # triangles straddling a segment border are not drawn by SlidingWedge
+        straddle = (angles + triangleWidth)*180/np.pi > (self._triSeg+1)*self.segWidth
+        if np.any(straddle):
+            vertices = np.array(stim.vertices).reshape(-1, 3, 2)
+            vertices[straddle] = 0  # collapse to the centre
+            stim.vertices = vertices.reshape(-1, 2)
+
+        # alternate segments go in and out
+        self._segDir = np.where(np.arange(nSegs) % 2 == 0, 1.0, -1.0)
+        self._segPhase = np.zeros(nSegs)
+        self._radialBase = stim._visibleTexture.reshape(-1, 3, 2)[:, :, 1].copy()
+
+    def draw(self):
+        self.stim.draw()
+
+    def setOri(self, ori):
+        self.stim.setOri(ori)
+
+    def incrementPhase(self):
+        if np.random.random() < self.changeProb:
+            self.radialRate *= (-1)  # flip the direction by negating the rate
+        self._segPhase += self._segDir*self.radialRate
+        self._updateRadialPhase()
+
+    def setTime(self, t):
+        # radial phase at time t (s), independent of the frame rate and drops
+        self._segPhase[:] = self._segDir*self.motion.position(t)
+        self._updateRadialPhase()
+
+    def _updateRadialPhase(self):
+        # one vectorised write into the texture coordinates of all segments.
+        # RadialStim subtracts radialPhase, so the segments move the same way
+        texCoords = self.stim._visibleTexture.reshape(-1, 3, 2)
+        texCoords[:, :, 1] = self._radialBase - \
+            self._segPhase[self._triSeg][:, np.newaxis]
+
+    def setMask(self, newmask):
+        self.stim._set('mask', newmask)
+
+
+def _reportStartup():
+    # for benchStartup.py: print (system-wide) perf_counter times when
+    # compatibility is imported and at the first flip, then stop the script
+    print(f"MRIVIS_IMPORTED {time.perf_counter():.6f}", flush=True)
+    flip = visual.Window.flip
+
+    def firstFlip(self, *args, **kwargs):
+        result = flip(self, *args, **kwargs)
+        print(f"MRIVIS_FIRST_FLIP {time.perf_counter():.6f}", flush=True)
+        os._exit(0)
+    visual.Window.flip = firstFlip
+
+
 # this is a compatibility layer for the scripts in this folder.
 # actually do the version check (if it's being imported)
 # can add code in here that will be run if this module is being imported.
@@ -581,6 +2156,8 @@ class SlidingWedge:
 if __name__ != "__main__":
     versionCheck()
     print("(compatibility) version check.")
+    if REPORT_STARTUP:
+        _reportStartup()
 else:
     print("(!!) This script is not meant to be run directly. It is a compatibility layer for other scripts.")
     sys.exit(1)
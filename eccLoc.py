@@ -14,13 +14,13 @@
 # 4 - stimSize - size of the stimulus in proportion to screen height
 
 
-from psychopy import core, visual, event, gui, plugins
+from psychopy import core, visual, event
 import numpy as np
 
 # provide a compatibility layer for newer versions of PsychoPy
 # and some site-specific parameters
 import compatibility
-from compatibility import waitForScanner
+import protocol
 
 parser = compatibility.setupParser()
 parser.add_argument('-on', '--onLength', default=12, type=float,
@@ -68,6 +68,7 @@ params['timeStr'] = compatibility.getTimeStr()
 
 # if GUI is asked for show it
 if args.useGUI:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
         dictionary=params,
         title="Eccentricity Localizer",
@@ -141,102 +142,22 @@ wedge4 = visual.RadialStim(myWin, tex='sqrXsqr', color=-1, size=stimSize,
                            visibleWedge=[0, 360], radialCycles=8, angularCycles=8, interpolate=False,
                            autoLog=False, ori=0, pos=(0, 0), mask=thisMask)  # this stim changes too much for autologging to be useful
 
-# from compatibility.py - reusable across code
-t0, tdelta = waitForScanner(myWin, fixation, method='digital')
+# stimulus ids in the schedule: 0 blank, 1 ring A (centre), 2 ring B (surround)
+# each as a pair of (positive, negative) contrast
+layers = {1: protocol.Layer((wedge1, wedge2)),
+          2: protocol.Layer((wedge3, wedge4))}
 
-if params['verbose']:
-    print(f"t0, tdelta: {t0},  {tdelta}")
+# null period, then A on / off / B on / off for each block
+blocks = [(0, nullPeriod)] + \
+    [(1, onLength), (0, offLength), (2, onLength), (0, offLength)]*numBlocks
 
-clock = core.Clock()
-
-
-# dict that keeps info related to hits, etc on fixation targets
-# should go into a function
+# fixation colours / targets
 fixationInfo = compatibility.FIXATION_INFO
 
-fixationInfo = compatibility.showNullPeriod(
-    myWin, fixation, fixationInfo, nullPeriod)
-# show the fixation cross for the null period
-
-# timing info for this loop?
-# maybe should pass around global timer?
-t = lastFPSupdate = 0
-t_p = 0
-trialClock = core.Clock()
-
-
-for i in range(0, (numBlocks)):
-    trialClock.reset()
-    t_p = 0
-    fn = fixationInfo['fn']
-    color_key = fixationInfo['color_key']
-    my_colors = fixationInfo['my_colors']
-    targFlag = 0  # remove in dict
-    nTargs, nTargsH, nTargsC, nTargsF = 0, 0, 0, 0
-
-    while trialClock.getTime() < (2*(onLength+offLength)):  # for 5 secs
-        t = trialClock.getTime()
-        t_diff = t-t_p
-        if t_diff > fixationInfo['fixLength']:
-            old_color_key = color_key
-            fnPrev = fn
-            while color_key == old_color_key:
-                fn = np.random.randint(len(my_colors.keys()))
-                color_key = list(my_colors.keys())[fn]
-            this_color = my_colors[color_key]
-            fixation.setColor(this_color)
-            if fn > 2:
-                nTargs = nTargs + 1
-                targTime = trialClock.getTime()
-                targFlag = 1
-            t_p = t
-        # set stim type depending on where we are in the cycle
-        if trialClock.getTime() < onLength:
-            if (t % flashPeriod) < (flashPeriod/2.0):  # (NB more accurate to use number of frames)
-                stim = wedge1
-            else:
-                stim = wedge2
-            stim.draw()
-        elif trialClock.getTime() < ((2*onLength)+offLength) and trialClock.getTime() > (onLength+offLength):
-            if (t % flashPeriod) < (flashPeriod/2.0):  # (NB more accurate to use number of frames)
-                stim = wedge3
-            else:
-                stim = wedge4
-            stim.draw()
-
-        fixation.draw()
-
-        myWin.flip()
-
-        for key in event.getKeys():
-            keyTime = trialClock.getTime()
-            if key in ['escape', 'q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-            elif key in ['1', '2', '3', '4']:
-                if targFlag:
-                    if (keyTime-targTime) < 1:  # make this time a param!
-                        nTargsC = nTargsC+1
-                        nTargsH = nTargsH+1
-                        targFlag = 0
-                        print("fix: hit")
-                else:
-                    nTargsC = nTargsC-1
-                    nTargsF = nTargsF+1
-                    print("fix: false alarm")
-
-            elif key in [compatibility.PAUSE_KEY] and compatibility.ALLOW_PAUSE:
-                # allow time for a screen shot, eg.
-                core.wait(compatibility.PAUSE_TIME)
-
-nTargsC = max(nTargsC, 0)
-print("nTargs:", int(nTargs))
-print("nTargsH:", int(nTargsH))
-print("nTargsF:", int(nTargsF))
-print("nTargsC:", int(nTargsC))
-
-print("Score: %.2f" % (nTargsC/nTargs*100))
+run = protocol.Protocol('eccLoc', blocks, layers, fixation, flashPeriod,
+                        fixationInfo=fixationInfo,
+                        stimNames={1: 'centre', 2: 'surround'}).compile(myWin)
+run.run(params)
 
 compatibility.endExperiment(myWin)
 
@@ -5,6 +5,11 @@ from numpy import sin, pi
 import math,sys
 import numpy as np
 
+# provide a compatibility layer for newer versions of PsychoPy
+# (block schedule compiler)
+import compatibility
+import protocol
+
 if len(sys.argv)>1:
     blockLength=int(sys.argv[1])
 else:
@@ -31,6 +36,8 @@ else:
     initDir=1
 
 
+compatibility.activatePlugins()
+
 #create a window to draw in
 myWin =visual.Window((1280,800),allowGUI=False,
 bitsMode=None, units='height', fullscr=0,winType='pyglet',monitor='testMonitor', color=0)
@@ -92,116 +99,21 @@ wedge4 = visual.RadialStim(myWin, tex='sqrXsqr', color=-1,size=stimSize,
 
 initialOri=0
 
-kwait = 1
-while kwait:
-    fixation.draw()
-    myWin.flip()
-    for key in event.getKeys():
-        if key in ['5']:
-            kwait = 0
-        elif key in ['escape','q']:
-#            print myWin.fps()
-            myWin.close()
-            core.quit()
-
-clock=core.Clock()
-trialClock = core.Clock()
-
-#nullOri=initialOri-(initDir*rotationRate*nullPeriod*180)
-#grating1.setOri(nullOri)
-
-color_key = 'red'
-this_color = my_colors[color_key]
-fixation.setColor(this_color)
-fn = 0;
-t = lastFPSupdate = 0
-t_p = 0
-
-nTargs = 0.;
-nTargsC = 0.;
-nTargsF = 0.;
-targTime= 1000;
-
-while trialClock.getTime()<nullPeriod:#for 5 secs
-    t=clock.getTime()
-    t_diff=t-t_p
-    if t_diff > fixLength:
-#        print "switch"
-        if color_key=='red':
-            color_key='green'
-        elif color_key=='green':
-            color_key='red'
-        this_color = my_colors[color_key]
-        fixation.setColor(this_color)
-        t_p = t
-    fixation.draw()
-    myWin.flip()
-    
-    for key in event.getKeys():
-        keyTime=trialClock.getTime()
-        if key in ['escape','q']:
-            print(myWin.fps())
-            myWin.close()
-            core.quit()
-        else:
-            if (keyTime-targTime)<1:
-                nTargsC=nTargsC+1
-            elif (keyTime-targTime)>1:
-                nTargsC=nTargsC-1
-                nTargsF=nTargsF+1
-t = lastFPSupdate = 0
-t_p = 0
-
-for i in range(0,(numBlocks)):
-    trialClock.reset()
-    t_p= 0
-    while trialClock.getTime()<blockLength:#for 5 secs
-        t=clock.getTime()
-        t_diff=t-t_p
-        if t_diff > fixLength:
-            print("switch")
-            if color_key=='red':
-                color_key='green'
-            elif color_key=='green':
-                color_key='red'
-            this_color = my_colors[color_key]
-            fixation.setColor(this_color)
-            t_p = t
-        
-        if trialClock.getTime()<blockLength/2:
-            if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-                stim = wedge1
-            else:
-                stim = wedge2
-        else:
-            if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-                stim = wedge3
-            else:
-                stim = wedge4
-
-        stim.draw()
-        fixation.draw()
-
-        myWin.flip()
-    
-        for key in event.getKeys():
-            keyTime=trialClock.getTime()
-            if key in ['escape','q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-            else:
-                if (keyTime-targTime)<1:
-                    nTargsC=nTargsC+1
-                elif (keyTime-targTime)>1:
-                    nTargsC=nTargsC-1
-                    nTargsF=nTargsF+1
-
-#print "nTargsC:", int(nTargsC)
-#print "nTargs:", int(nTargs)
-#print "nTargsF:", int(nTargsF)
-#print "Score: %.2f" % (nTargsC/nTargs*100)
+# stimulus ids in the schedule: 0 blank, 1 right hemifield, 2 left hemifield
+# each as a pair of (positive, negative) contrast
+layers = {1: protocol.Layer((wedge1, wedge2)),
+          2: protocol.Layer((wedge3, wedge4))}
+
+# null period, then each block is half right, half left
+blocks = [(0, nullPeriod)] + [(1, blockLength/2), (2, blockLength/2)]*numBlocks
+
+# fixation alternates red / green every fixLength (no target task)
+run = protocol.Protocol('hemiResp', blocks, layers, fixation, flashPeriod,
+                        fixationColors=[my_colors['red'], my_colors['green']],
+                        fixLength=fixLength, stimNames={1: 'right', 2: 'left'},
+                        method='keyboard').compile(myWin)
+run.run({'blockLength': blockLength, 'numBlocks': numBlocks,
+         'nullPeriod': nullPeriod, 'stimSize': stimSize, 'initDir': initDir})
 
 myWin.close()
 core.quit()
-
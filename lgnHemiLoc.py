@@ -6,12 +6,13 @@
 # ./hemiLoc.py -h # for help
 # ./hemiLoc.py -g # for entering values via GUI
 
-from psychopy import core, visual, event, gui, plugins
+from psychopy import core, visual, event
 import numpy as np
 
 # provide a compatibility layer for newer versions of PsychoPy
 # and some site-specific parameters
 import compatibility
+import protocol
 
 parser = compatibility.setupParser()
 parser.add_argument('-bl', '--blockLength', default=12, type=float,
@@ -51,6 +52,7 @@ params['timeStr'] = compatibility.getTimeStr()
 
 if params['useGUI']:
     # if the user wants to use the GUI, create a dialog box
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
         dictionary=params,
         title="Hemifield Localizer",
@@ -122,114 +124,21 @@ wedge4 = visual.RadialStim(myWin, tex='sqrXsqr', color=-1, size=stimSize,
 # initialOri = 0
 
 
-compatibility.waitForScanner(myWin, fixation)
+# stimulus ids in the schedule: 0 blank, 1 right hemifield, 2 left hemifield
+# each as a pair of (positive, negative) contrast
+layers = {1: protocol.Layer((wedge1, wedge2)),
+          2: protocol.Layer((wedge3, wedge4))}
 
+# null period, then each block is half right, half left
+blocks = [(0, nullPeriod)] + \
+    [(1, blockLength/2), (2, blockLength/2)]*numBlocks
 
-clock = core.Clock()
-
-color_key = 'white'
-fn = 0
-trialClock = core.Clock()
-
-t = lastFPSupdate = 0
-t_p = 0
-
-# dict that keeps info related to hits, etc on fixation targets
-# should go into a funciont
-fixationInfo = {
-    'nTargsH': 0,
-    'nTargs': 0,
-    'nTargsC': 0,
-    'nTargsF': 0,
-    'targTime': 1000,
-    'targFlag': 0,
-    'color_key': 'white',
-    'fn': 0,
-    'my_colors': {'red': [1, 0, 0],
-                  'green': [0, 1, 0],
-                  'blue': [0, 0, 1],
-                  'yellow': [1, 1, 0]},
-    'fixLength': 1.0/2
-}
-
-fixationInfo = compatibility.showNullPeriod(
-    myWin, fixation, fixationInfo, nullPeriod)
-# show the fixation cross for the null period
-
-nTargs, nTargsH, nTargsC, nTargsF = 0, 0, 0, 0
-
-targFlag = 0
-targTime = 1000
-
-# timing info for this loop?
-# maybe should pass around global timer?
-
-t = lastFPSupdate = 0
-t_p = 0
-
-for i in range(0, numBlocks):
-    trialClock.reset()
-    t_p = 0
-    while trialClock.getTime() < blockLength:  # for 5 secs
-        t = trialClock.getTime()
-        t_diff = t-t_p
-        if t_diff > fixLength:
-            old_color_key = color_key
-            fnPrev = fn
-            while color_key == old_color_key:
-                fn = np.random.randint(len(my_colors.keys()))
-                color_key = list(my_colors.keys())[fn]
-            this_color = my_colors[color_key]
-            fixation.setColor(this_color)
-            if fn > 2:
-                nTargs = nTargs + 1
-                targTime = trialClock.getTime()
-                targFlag = 1
-            t_p = t
-
-        if trialClock.getTime() < blockLength/2:
-            if (t % flashPeriod) < (flashPeriod/2.0):  # (NB more accurate to use number of frames)
-                stim = wedge1
-            else:
-                stim = wedge2
-        else:
-            if (t % flashPeriod) < (flashPeriod/2.0):  # (NB more accurate to use number of frames)
-                stim = wedge3
-            else:
-                stim = wedge4
-
-        stim.draw()
-        fixation.draw()
-
-        myWin.flip()
-
-        for key in event.getKeys():
-            keyTime = trialClock.getTime()
-            if key in ['escape', 'q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-            elif key in ['1', '2', '3', '4']:
-                if targFlag:
-                    if (keyTime-targTime) < 1:
-                        nTargsC = nTargsC+1
-                        nTargsH = nTargsH+1
-                        targFlag = 0
-                else:
-                    nTargsC = nTargsC-1
-                    nTargsF = nTargsF+1
-            elif key in [compatibility.PAUSE_KEY] and compatibility.ALLOW_PAUSE:
-                # allow time for a screen shot, eg.
-                core.wait(compatibility.PAUSE_TIME)
-
-
-nTargsC = max(nTargsC, 0)
-print("nTargs:", int(nTargs))
-print("nTargsH:", int(nTargsH))
-print("nTargsF:", int(nTargsF))
-print("nTargsC:", int(nTargsC))
-
-print("Score: %.2f" % (nTargsC/nTargs*100))
+run = protocol.Protocol(
+    'lgnHemiLoc', blocks, layers, fixation, flashPeriod,
+    fixationInfo=dict(compatibility.FIXATION_INFO, my_colors=my_colors,
+                      fixLength=fixLength),
+    stimNames={1: 'right', 2: 'left'}).compile(myWin)
+run.run(params)
 
 compatibility.endExperiment(myWin)
 
@@ -2,7 +2,7 @@
 # minimalScreenTest.py
 
 # minimal screen test for PsychoPy
-from psychopy import core, visual, event, gui, plugins
+from psychopy import core, visual, event
 import numpy as np
 
 # provide a compatibility layer for newer versions of PsychoPy
@@ -12,9 +12,12 @@
 # 7 - byCon - contrast for blue eye
 # 8 - annulSize - size of the fixation annulus relative to stim
 #!/usr/bin/env python
-from psychopy import visual, event, core, monitors,gui
+from psychopy import visual, event, core, monitors
 import math,sys,time
 
+import compatibility
+import protocol
+
 
 if len(sys.argv)>1:
     blockLength=float(sys.argv[1])
@@ -75,6 +78,7 @@ params = {
 params['timeStr']= time.strftime("%b_%d_%H%M", time.localtime())
 
 if len(sys.argv)<10:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
             dictionary=params,
             title="ODC Localizer",
@@ -97,6 +101,8 @@ params['byCon']=byCon,
 params['annulSize']=annulSize,
 params['initBlank']=initBlank,
 
+compatibility.activatePlugins()
+
 mon = monitors.Monitor('testMonitor',width=58,distance=57)
 
 #create a myWindow to draw in
@@ -117,21 +123,8 @@ annul= visual.RadialStim(myWin, tex='sqrXsqr', color=(0,0,0),size=stimSize*annul
                            visibleWedge=[0, 360], radialCycles=4, angularCycles=8, interpolate=False,
                            autoLog=False,ori=0,pos=(0,0))#this stim changes too much for autologging to be useful
 
-kwait = 1
-while kwait:
-    fixation.draw()
-    myWin.flip()
-    for key in event.getKeys():
-        if key in ['5']:
-            kwait = 0
-        elif key in ['escape','q']:
-            print(myWin.fps())
-            myWin.close()
-            core.quit()
-    
 fixation.setLineColor('black')
 
-globalClock = core.Clock()
 initialOri=0
 
 wedgeB1 = visual.RadialStim(myWin, tex='sqrXsqr', color=(1,1,1),size=stimSize,
@@ -171,112 +164,29 @@ wedgeR2 = visual.RadialStim(myWin, tex='sqrXsqr', color=(0,-byCon,-byCon),size=s
 
 
 
-clock=core.Clock()
-
-#while clock.getTime()<nullPeriod:#for 5 secs
-#    fixation.draw()
-#    fixation1.draw()
-#    fixation2.draw()
-#    myWin.flip()
-#    for key in event.getKeys():
-#        if key in ['escape','q']:
-#            print myWin.fps()
-#            myWin.close()
-#            core.quit()
-
-t=0
-rotationRate = .03 #revs per sec
 flashPeriod = 0.2 #seconds for one B-W cycle (ie 1/Hz)
-whichEye=initEye
-
-clock.reset()
-while clock.getTime()<initBlank:#for 5 secs
-    fixation.draw()
-    myWin.flip()
-    for key in event.getKeys():
-        if key in ['escape','q']:
-            print(myWin.fps())
-            myWin.close()
-            core.quit()
 
-if whichEye == 2:
-    clock.reset()
-    while clock.getTime()<(blockLength):#for 5 secs
-        t=globalClock.getTime()
-        if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-            stim = wedgeB1
-        else:
-            stim = wedgeB2
-        stim.draw()
-        annul.draw()
-        fixation.draw()
-        myWin.flip()
-        for key in event.getKeys():
-            if key in ['escape','q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-    clock.reset()
-    while clock.getTime()<blankPeriod:#for 5 secs
-        fixation.draw()
-        myWin.flip()
-        for key in event.getKeys():
-            if key in ['escape','q']:
-                print(myWin.fps())
-               
-                myWin.close()
-                core.quit()
-    whichEye=1;
-
-for i in range(0,numBlocks):
-    clock.reset()
-    while clock.getTime()<(blockLength):#for 5 secs
-        t=globalClock.getTime()
-        if whichEye == 1:
-            if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-                stim = wedgeL1
-            else:
-                stim = wedgeL2
-        elif whichEye == -1:
-            if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-                stim = wedgeR1
-            else:
-                stim = wedgeR2
-
-        #stim.setOri(initialOri+(rotDir*t*rotationRate*360.0))
-        stim.draw()
-        annul.draw()
-        fixation.draw()
-        myWin.flip()
-        for key in event.getKeys():
-            if key in ['escape','q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-    whichEye=whichEye*-1
-    clock.reset()
-    while clock.getTime()<blankPeriod:#for 5 secs
-        fixation.draw()
-        myWin.flip()
-        for key in event.getKeys():
-            if key in ['escape','q']:
-                print(myWin.fps())
-                myWin.close()
-                core.quit()
-clock.reset()
+# stimulus ids in the schedule: 0 blank, 1 both eyes, 2 left (red), 3 right (blue)
+# each as a pair of (positive, negative) contrast, inside the fixation annulus
+layers = {1: protocol.Layer((wedgeB1, wedgeB2), overlays=[annul]),
+          2: protocol.Layer((wedgeL1, wedgeL2), overlays=[annul]),
+          3: protocol.Layer((wedgeR1, wedgeR2), overlays=[annul])}
 
+# initial blank, optionally a binocular block, then alternating eyes
+blocks = [(0, initBlank)]
+whichEye = initEye
+if whichEye == 2:
+    blocks += [(1, blockLength), (0, blankPeriod)]
+    whichEye = 1
+for i in range(0, numBlocks):
+    blocks += [(2 if whichEye == 1 else 3, blockLength), (0, blankPeriod)]
+    whichEye = whichEye*-1
+
+# trigger from the keyboard ('5' / 't'), as before
+run = protocol.Protocol('odcLoc', blocks, layers, fixation, flashPeriod,
+                        stimNames={1: 'both', 2: 'left', 3: 'right'},
+                        method='keyboard').compile(myWin)
+run.run(params)
 
-    
 myWin.close()
 core.quit()
-#            
-#            
-#            
-#    #handle key presses each frame
-#    for key in event.getKeys():
-#        if key in ['escape','q']:
-#            print myWin.fps()
-#            myWin.close()
-#            core.quit()
-#    event.clearEvents('mouse')#only really needed for pygame myWindows
-#
@@ -11,7 +11,7 @@
 # 6 - gyCon - contrast for red eye
 # 7 - byCon - contrast for blue eye
 
-from psychopy import visual, event, core, monitors,gui
+from psychopy import visual, event, core, monitors
 import math,sys,time
 
 
@@ -62,6 +62,7 @@ params = {
 params['timeStr']= time.strftime("%b_%d_%H%M", time.localtime())
 
 if len(sys.argv)<10:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
             dictionary=params,
             title="ODC Localizer",
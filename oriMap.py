@@ -14,15 +14,14 @@
 # ./oriMap.py -g  # for entering values via GUI
 
 
-from psychopy import core, visual, event, gui, plugins
+from psychopy import core, visual, event
 from numpy import sin, pi
 import math
 import sys
 import time
 import numpy as np
 import compatibility
-
-from compatibility import waitForScanner
+import protocol
 
 parser = compatibility.setupParser()
 parser.add_argument('-bl', '--blockLength', default=60, type=float,
@@ -62,6 +61,7 @@ args = parser.parse_args()
 params = args.__dict__.copy()
 
 if args.useGUI:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
         dictionary=params,
         title="Ori map localizer",
@@ -117,203 +117,25 @@ grating1 = visual.GratingStim(myWin, tex="sin", mask="raisedCos", texRes=256,
                               autoLog=False)  # this stim changes too much for autologging to be useful
 
 initialOri = 0
-compatibility.waitForScanner(myWin, fixation)
-
-clock = core.Clock()
-
-nullOri = initialOri-(initDir*rotationRate*nullPeriod*180)
-grating1.setOri(nullOri)
-
-color_key = 'white'
-fn = 0
-trialClock = core.Clock()
-
-t = lastFPSupdate = 0
-t_p = 0
-
-# dict that keeps info related to hits, etc on fixation targets
-# should go into a funciont
-fixationInfo = {
-    'nTargsH': 0,
-    'nTargs': 0,
-    'nTargsC': 0,
-    'nTargsF': 0,
-    'targTime': 1000,
-    'targFlag': 0,
-    'color_key': 'white',
-    'fn': 0,
-    'my_colors': {'red': [1, 0, 0],
-                  'green': [0, 1, 0],
-                  'blue': [0, 0, 1],
-                  'yellow': [1, 1, 0]},
-    'fixLength': 1.0/2
-}
-
-fixationInfo = compatibility.showNullPeriod(
-    myWin, fixation, fixationInfo, nullPeriod)
-# show the fixation cross for the null period
-
-
-# nTargs = 0
-# nTargsH = 0
-# nTargsC = 0
-# nTargsF = 0
-# targTime = 1000
-# respFlag = 0
-
-while trialClock.getTime() < nullPeriod:  # for 5 secs
-    t = trialClock.getTime()
-    t_diff = t-t_p
-
-    fn = fixationInfo['fn']
-    color_key = fixationInfo['color_key']
-    my_colors = fixationInfo['my_colors']
-    nTargs, nTargsH, nTargsC, nTargsF = 0, 0, 0, 0
-
-    if t_diff > fixationInfo['fixLength']:
-        old_color_key = color_key
-        fnPrev = fn
-        respFlag = 0
-        while color_key == old_color_key:
-            fn = np.random.randint(len(my_colors.keys()))
-            color_key = list(my_colors.keys())[fn]
-        this_color = my_colors[color_key]
-        fixation.setColor(this_color)
-        if fn > 2:
-            respFlag = 1
-            nTargs = nTargs + 1
-            targTime = trialClock.getTime()
-        t_p = t
-
-    grating1.setOri(nullOri+(t*initDir*rotationRate*180))
-    if (t % 2 < 1):
-        grating1.setPhase(t*4)
-    else:
-        grating1.setPhase(t*-4)
-
-    fixation.draw()
-    myWin.flip()
-
-    for key in event.getKeys():
-        keyTime = trialClock.getTime()
-        if key in ['escape', 'q']:
-            myWin.close()
-            core.quit()
-        elif key in ['1', '2', '3', '4']:
-            if (keyTime-targTime) < 1:
-                if respFlag:
-                    nTargsC = nTargsC+1
-                    nTargsH = nTargsH+1
-                    respFlag = 0
-            elif (keyTime-targTime) > 1:
-                nTargsC = nTargsC-1
-                nTargsF = nTargsF+1
-
-t = lastFPSupdate = 0
-t_p = 0
-
-for i in range(0, (numBlocks)):
-    trialClock.reset()
-    t_p = 0
-    my_colors = fixationInfo['my_colors']
-    nTargs, nTargsH, nTargsC, nTargsF = 0, 0, 0, 0
-    fn = fixationInfo['fn']
-    while trialClock.getTime() < blockLength:  # for 5 secs
-        t = trialClock.getTime()
-        t_diff = t-t_p
-        if t_diff > fixationInfo['fixLength']:
-            old_color_key = color_key
-            fnPrev = fn
-            respFlag = 0
-            while color_key == old_color_key:
-                fn = np.random.randint(len(my_colors.keys()))
-                color_key = list(my_colors.keys())[fn]
-            this_color = my_colors[color_key]
-            fixation.setColor(this_color)
-            if fn > 2:
-                respFlag = 1
-                nTargs = nTargs + 1
-                targTime = trialClock.getTime()
-            t_p = t
-
-        grating1.setOri(initialOri+(t*initDir*rotationRate*180))
-        if (t % 2 < 1):
-            grating1.setPhase(t*4)
-        else:
-            grating1.setPhase(t*-4)
-        grating1.draw()
-        central_grey.draw()
-        fixation.draw()
-
-        myWin.flip()
-
-        for key in event.getKeys():
-            keyTime = trialClock.getTime()
-            if key in ['escape', 'q']:
-                myWin.close()
-                core.quit()
-            elif key in ['1', '2', '3', '4']:
-                if (keyTime-targTime) < 1:
-                    if respFlag:
-                        nTargsC = nTargsC+1
-                        nTargsH = nTargsH+1
-                        respFlag = 0
-                elif (keyTime-targTime) > 1:
-                    nTargsC = nTargsC-1
-                    nTargsF = nTargsF+1
-
-trialClock.reset()
-t_p = 0
-while trialClock.getTime() < nullPeriod:  # for 5 secs
-    t = trialClock.getTime()
-    t_diff = t-t_p
-    if t_diff > fixLength:
-        old_color_key = color_key
-        fnPrev = fn
-        respFlag = 0
-        while color_key == old_color_key:
-            fn = np.random.randint(len(my_colors.keys()))
-            color_key = list(my_colors.keys())[fn]
-        this_color = my_colors[color_key]
-        fixation.setColor(this_color)
-        if fn > 2:
-            respFlag = 1
-            nTargs = nTargs + 1
-            targTime = trialClock.getTime()
-        t_p = t
-
-    grating1.setOri(nullOri+(t*initDir*rotationRate*180))
-    if (t % 2 < 1):
-        grating1.setPhase(t*4)
-    else:
-        grating1.setPhase(t*-4)
-    # grating1.draw()
-    fixation.draw()
 
-    myWin.flip()
+# stimulus ids in the schedule: 0 blank (fixation only), 1 rotating grating.
+# the grating turns 180 deg per block, and its drift reverses every second
+layers = {1: protocol.Layer(
+    grating1,
+    ori=lambda t, tBlock: initialOri + tBlock*initDir*rotationRate*180,
+    phase=lambda t, tBlock: np.where(tBlock % 2 < 1, tBlock*4, tBlock*-4),
+    overlays=[central_grey])}
 
-    for key in event.getKeys():
-        keyTime = trialClock.getTime()
-        if key in ['escape', 'q']:
-            myWin.close()
-            core.quit()
-        else:
-            if (keyTime-targTime) < 1:
-                if respFlag:
-                    nTargsC = nTargsC+1
-                    nTargsH = nTargsH+1
-                    respFlag = 0
-            elif (keyTime-targTime) > 1:
-                nTargsC = nTargsC-1
-                nTargsF = nTargsF+1
+# null period, rotating blocks, null period
+blocks = [(0, nullPeriod)] + [(1, blockLength)]*numBlocks + [(0, nullPeriod)]
 
-nTargsC = max(nTargsC, 0)
-print("nTargs:", int(nTargs))
-print("nTargsH:", int(nTargsH))
-print("nTargsF:", int(nTargsF))
-print("nTargsC:", int(nTargsC))
+run = protocol.Protocol('oriMap', blocks, layers, fixation, flashPeriod,
+                        fixationInfo=dict(compatibility.FIXATION_INFO,
+                                          fixLength=1.0/2),
+                        stimNames={1: 'grating'}).compile(myWin)
+run.run(params)
 
-print("Score: %.2f" % (nTargsC/nTargs*100))
+compatibility.endExperiment(myWin)
 
 myWin.close()
 core.quit()
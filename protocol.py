@@ -0,0 +1,296 @@
+# protocol.py
+
+# block-design runs as a declarative spec: a list of (stimId, duration)
+# blocks, a Layer for each stimulus id, the fixation and its task. compile()
+# turns the spec into per-frame tables once; run() is the one frame loop all
+# the localizers share, with the same instrumentation everywhere (block
+# markers on the DOUT, FrameRecorder, FrameJournal, fixation task, keys,
+# run record for bidsEvents.py).
+#
+#   spec = protocol.Protocol('eccLoc', blocks,
+#                            {1: protocol.Layer((wedge1, wedge2)),
+#                             2: protocol.Layer((wedge3, wedge4))},
+#                            fixation, flashPeriod=0.25,
+#                            fixationInfo=compatibility.FIXATION_INFO)
+#   run = spec.compile(myWin)
+#   result = run.run(params)
+
+from psychopy import core
+import numpy as np
+
+import compatibility
+
+
+class Layer:
+    """
+    What to draw for one stimulus id.
+
+    stims is a single stimulus, or a (positive, negative) pair that flickers
+    with the schedule polarity. ori and phase are optional functions of
+    (t, tBlock) - arrays of seconds since the trigger / since the block
+    onset - evaluated for every frame at compile time. overlays are drawn
+    on top of the stimulus (e.g. a central grey patch), under the fixation.
+    """
+
+    def __init__(self, stims, ori=None, phase=None, overlays=()):
+        self.stims = tuple(stims) if isinstance(stims, (tuple, list)) else (stims,)
+        self.ori = ori
+        self.phase = phase
+        self.overlays = tuple(overlays)
+
+
+class Protocol:
+    """
+    A block-design run: blocks, stimulus layers, flicker and fixation task.
+
+    blocks is a list of (stimId, duration); stimId 0 is blank (fixation
+    only) and every other id needs a Layer in layers. The fixation either
+    runs the colour task (fixationInfo, see FixationTask), cycles through
+    fixationColors every fixLength, or stays as it is. method is passed on
+    to waitForScanner; block markers go on the DOUT only with the 'digital'
+    method (other setups may have no device to write them).
+    """
+
+    def __init__(self, name, blocks, layers, fixation, flashPeriod=0.25,
+                 fixationInfo=None, fixationColors=None, fixLength=None,
+                 stimNames=None, method='digital', record=True):
+        self.name = name
+        self.blocks = list(blocks)
+        self.layers = dict(layers)
+        self.fixation = fixation
+        self.flashPeriod = flashPeriod
+        self.fixationInfo = fixationInfo
+        self.fixationColors = fixationColors
+        if fixLength is None and fixationInfo is not None:
+            fixLength = fixationInfo['fixLength']
+        self.fixLength = fixLength
+        self.stimNames = stimNames
+        self.method = method
+        self.record = record
+
+        missing = {stimId for (stimId, _) in self.blocks} - set(self.layers) - {0}
+        if missing:
+            raise ValueError(f"(protocol) no layer for stimulus ids {sorted(missing)}")
+
+    def compile(self, myWin, frameRate=None):
+        """
+        Per-frame tables for run(). Also registers the stimuli for warm-up.
+        """
+        return CompiledProtocol(self, myWin, frameRate)
+
+
+class CompiledProtocol:
+    """
+    A Protocol compiled for a window: per-frame schedule and draw tables.
+
+    Every frame has a code - one per (stimulus id, polarity) that occurs -
+    and the code indexes a tuple of bound draw methods and a tuple of
+    (setter, per-frame values) updates. The frame loop does no lookups by
+    name and no arithmetic beyond nextFrame().
+    """
+
+    def __init__(self, spec, myWin, frameRate=None):
+        self.spec = spec
+        self.myWin = myWin
+        self.frameRate = frameRate or compatibility.measureFrameRate(myWin)
+        schedule = compatibility.compileSchedule(spec.blocks, self.frameRate,
+                                                 spec.flashPeriod, spec.fixLength)
+        self.schedule = schedule
+        self.nFrames = nFrames = len(schedule)
+        t = schedule['time']
+        frames = np.arange(nFrames)
+        onset = np.flatnonzero(np.diff(schedule['block'], prepend=-1))
+        blockStart = onset[np.searchsorted(onset, frames, side='right') - 1]
+        tBlock = t - t[blockStart]
+
+        # one code per (stimulus, polarity) combination in the schedule
+        negative = (schedule['polarity'] < 0).astype(int)
+        pairs, self.code = np.unique(np.stack([schedule['stim'], negative], axis=1),
+                                     axis=0, return_inverse=True)
+        self.code = self.code.ravel()
+        fixation = spec.fixation
+        self.draws = []
+        self.updates = []
+        # orientation / phase of every frame, for the journal
+        self.ori = np.zeros(nFrames, dtype=np.float32)
+        self.phase = schedule['polarity'].astype(np.float32)
+        for (stimId, isNegative) in pairs:
+            if stimId == 0:
+                self.draws.append((fixation.draw,))
+                self.updates.append(())
+                continue
+            layer = spec.layers[stimId]
+            stim = layer.stims[isNegative % len(layer.stims)]
+            self.draws.append((stim.draw,) + tuple(o.draw for o in layer.overlays)
+                              + (fixation.draw,))
+            inLayer = schedule['stim'] == stimId
+            updates = []
+            if layer.ori is not None:
+                values = np.broadcast_to(layer.ori(t, tBlock), t.shape).astype(float)
+                updates.append((stim.setOri, values))
+                self.ori[inLayer] = values[inLayer]
+            if layer.phase is not None:
+                values = np.broadcast_to(layer.phase(t, tBlock), t.shape).astype(float)
+                updates.append((stim.setPhase, values))
+                self.phase[inLayer] = values[inLayer]
+            self.updates.append(tuple(updates))
+        self.draws = tuple(self.draws)
+        self.updates = tuple(self.updates)
+
+        self.task = None
+        if spec.fixationInfo is not None:
+            self.task = compatibility.FixationTask(nFrames/self.frameRate,
+                                                   spec.fixationInfo)
+        self.fixationColors = None
+        if spec.fixationColors is not None:
+            self.fixationColors = [np.asarray(c, dtype=float) for c in spec.fixationColors]
+
+        # drawn once before the trigger, so textures are uploaded by then
+        for layer in spec.layers.values():
+            for stim in layer.stims + layer.overlays:
+                compatibility.registerStim(stim)
+        compatibility.registerStim(fixation)
+
+        self.recorder = None
+        self.journal = None
+        self.prefix = spec.name
+        # frame i is evaluated for (and should be shown at) t0 + its schedule
+        # time; the predictor keeps track of how far off that was
+        self.predictor = compatibility.FlipPredictor(self.frameRate)
+
+    def run(self, params=None):
+        """
+        Wait for the trigger, show the run, and report / save it. Returns
+        the fixation task score (None without a task).
+        """
+        spec = self.spec
+        params = {} if params is None else params
+        timeStr = params.get('timeStr') or compatibility.getTimeStr()
+        self.prefix = prefix = f"{spec.name}-{timeStr}"
+        if spec.record:
+            self.recorder = compatibility.FrameRecorder(self.frameRate)
+            # crash-safe copy of the frame state (compatibility.loadJournal)
+            self.journal = compatibility.FrameJournal(f"journal-{prefix}.npy",
+                                                      self.nFrames + 1024)
+
+        t0, tdelta = compatibility.waitForScanner(self.myWin, spec.fixation,
+                                                  method=spec.method)
+        self.t0 = t0
+        if self.recorder is not None:
+            self.recorder.setAnchor(t0)
+        if params.get('verbose'):
+            print(f"t0, tdelta: {t0},  {tdelta}")
+
+        self._frameLoop(t0)
+        self.predictor.report()
+
+        result = None
+        if self.task is not None:
+            # hits, false alarms and reaction times, all in one go
+            result = self.task.report(until=self.nFrames/self.frameRate)
+        self._save(params, prefix)
+        return result
+
+    def _frameLoop(self, t0):
+        myWin = self.myWin
+        fixation = self.spec.fixation
+        frameRate = self.frameRate
+        nFrames = self.nFrames
+        schedule = self.schedule
+        scheduleTime = schedule['time'] + t0
+        scheduleBlock = schedule['block']
+        scheduleStim = schedule['stim']
+        scheduleFixation = schedule['fixation']
+        code = self.code
+        draws = self.draws
+        updates = self.updates
+        task = self.task
+        fixationColors = self.fixationColors
+        recorder = self.recorder
+        journal = self.journal
+        ori = self.ori
+        phase = self.phase
+        getTime = core.getTime
+        flip = myWin.flip
+        flipped = self.predictor.flipped
+        markers = self.spec.method == 'digital'
+        markNextFlip = compatibility.markNextFlip
+        writeFrameMarkers = compatibility.writeFrameMarkers
+        nextFrame = compatibility.nextFrame
+        collectGarbage = compatibility.collectGarbage
+        buttonCodes = compatibility.BUTTON_CODES
+
+        lastBlock = -1
+        lastFixation = -1
+        # the frame loop only indexes into the tables. times are relative to
+        # the trigger, so onsets don't drift across blocks
+        i = 0
+        while i < nFrames:
+            if scheduleBlock[i] != lastBlock:
+                # block onset marker on the DOUT, written at the sync of this flip
+                lastBlock = scheduleBlock[i]
+                if markers:
+                    markNextFlip(scheduleStim[i] + 1)
+                if scheduleStim[i] == 0:
+                    # a blank block: the one place garbage is collected in
+                    # realtime mode (a young-generation pass, well under a frame)
+                    collectGarbage()
+            if task is not None:
+                task.show(scheduleFixation[i], fixation)
+            elif fixationColors is not None and scheduleFixation[i] != lastFixation:
+                lastFixation = scheduleFixation[i]
+                fixation.setColor(fixationColors[lastFixation % len(fixationColors)])
+
+            c = code[i]
+            for (setter, values) in updates[c]:
+                setter(values[i])
+            for draw in draws[c]:
+                draw()
+
+            if markers:
+                writeFrameMarkers()
+            flip()
+            flipped(getTime(), scheduleTime[i])
+            if recorder is not None:
+                recorder.record(i, scheduleBlock[i])
+                journal.record(i, scheduleStim[i], ori[i], phase[i],
+                               -1 if task is None else task.colorIndex())
+            i = nextFrame(getTime() - t0, frameRate)
+
+            for key in compatibility.getKeys():
+                keyTime = getTime() - t0
+                if key in ['escape', 'q']:
+                    self.abort()
+                elif key in buttonCodes:
+                    if task is not None:
+                        task.respond(keyTime)
+                    if journal is not None:
+                        journal.flagResponse(compatibility.RESPONSE_BUTTON)
+                elif key in [compatibility.PAUSE_KEY] and compatibility.ALLOW_PAUSE:
+                    # allow time for a screen shot, eg.
+                    core.wait(compatibility.PAUSE_TIME)
+
+    def _save(self, params, prefix):
+        frames = None
+        if self.recorder is not None:
+            self.recorder.summary()
+            self.recorder.save(f"frames-{prefix}.npy")
+            frames = self.recorder.frames()
+        # schedule, flips and responses, for bidsEvents.py
+        compatibility.saveRun(f"run-{prefix}.npz", self.spec.name, params, self.t0,
+                              self.schedule, frames, self.task,
+                              stimNames=self.spec.stimNames,
+                              until=self.nFrames/self.frameRate)
+
+    def abort(self):
+        """
+        User quit: keep what was recorded so far, then close and quit.
+        """
+        print(self.myWin.fps())
+        if self.journal is not None:
+            self.journal.flagResponse(compatibility.RESPONSE_KEY_QUIT)
+        if self.recorder is not None:
+            self.recorder.summary()
+            self.recorder.save(f"frames-{self.prefix}.npy")
+        self.myWin.close()
+        core.quit()
@@ -6,11 +6,11 @@
 # refactored for use on VPIXX at SPMIC by ds
 # can measure vf centre and coverage usin visualField.py
 
-from psychopy import visual, event, core, monitors, gui,  plugins  # misc
-from psychopy import hardware
+from psychopy import visual, event, core  # misc
 import numpy as np
 import compatibility
 from compatibility import waitForScanner, FlickeringAnnulus, SlidingAnnulus, SlidingWedge
+from compatibility import BatchedSlidingWedge, BatchedSlidingAnnulus
 
 # last run of visual field
 # try:
@@ -44,8 +44,12 @@ parser.add_argument('-ar', '--angularRate', default=0.3, type=float,
                     help='Angular rate of change')
 parser.add_argument('-cp', '--changeProbability', default=0.05, type=float,
                     help='Probability of direction change (per frame)')
+parser.add_argument('-seed', '--seed', default=None, type=int,
+                    help='Seed for the direction changes (default: new each run)')
 parser.add_argument('-fp', '--flashPeriod', default=0.25, type=float,
                     help='Flash period (seconds)')
+parser.add_argument('-b', help='Use batched (single draw) stimulus classes',
+                    dest='batched', action='store_true')
 parser.add_argument('-g', help='Use the GUI to set params',
                     dest='useGUI', action='store_true')
 parser.add_argument('-v', help='Set verbose output',
@@ -72,6 +76,7 @@ tip = {'direction': 'exp / con / cw / ccw',
        'dutyCycleWedge': 'Duty cycle of wedge, fraction of 1 (2pi)',
        'dutyCycleRing': 'Duty cycle of ring (fraction)',
        'flashPeriod': 0.25,
+       'batched': 'single draw call per stimulus (faster)',
        'useGUI': True,
        'verbose': False}
 
@@ -84,6 +89,7 @@ params['centre_y'] = visField['centre_y']
 
 # if GUI is asked for show it
 if args.useGUI:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
         dictionary=params,
         title="Retinotopy",
@@ -109,14 +115,24 @@ angularRate = params['angularRate']
 
 params['centre'] = np.array((params['centre_x'], params['centre_y']))
 
+# direction changes are drawn up front from this seed (saved with the run,
+# in run-*.npz), and the motion is a function of time - the same speed at
+# any refresh rate
+if params['seed'] is None:
+    params['seed'] = np.random.SeedSequence().entropy
+print(f"direction change seed: {params['seed']}")
+
 if params['direction'] in ['cw', 'ccw']:
     # create an instance of our wedge
-    wedge = SlidingWedge(myWin, pos=params['centre'], size=params['size'],
-                         dutyCycle=params['dutyCycleWedge'])  # changeProb=changeProbability, angularRate=angularRate
+    Wedge = BatchedSlidingWedge if params['batched'] else SlidingWedge
+    wedge = Wedge(myWin, pos=params['centre'], size=params['size'],
+                  dutyCycle=params['dutyCycleWedge'], seed=params['seed'])  # changeProb=changeProbability, angularRate=angularRate
 else:
-    annulus = SlidingAnnulus(myWin, pos=params['centre'], size=params['size'],
-                             dutyCycle=params['dutyCycleRing'],
-                             changeProb=changeProbability, angularRate=angularRate)
+    Annulus = BatchedSlidingAnnulus if params['batched'] else SlidingAnnulus
+    annulus = Annulus(myWin, pos=params['centre'], size=params['size'],
+                      dutyCycle=params['dutyCycleRing'],
+                      changeProb=changeProbability, angularRate=angularRate,
+                      seed=params['seed'])
     # annulus = FlickeringAnnulus(myWin, pos=params['centre'], size=params['size'],
     #                            dutyCycle=params['dutyCycleRing'])
 
@@ -128,6 +144,17 @@ fixation = compatibility.createFixation(myWin)
 
 fixationInfo = compatibility.FIXATION_INFO
 
+# record every flip, so we can check for dropped frames after the run
+frameRate = compatibility.measureFrameRate(myWin)
+recorder = compatibility.FrameRecorder(frameRate)
+framesFile = f"frames-retinotopy-{params['direction']}-{params['timeStr']}.npy"
+# parameters (with the seed) and flips, as the protocol scripts save them
+runFile = f"run-retinotopy-{params['direction']}-{params['timeStr']}.npz"
+# crash-safe copy of the frame state (compatibility.loadJournal to read back)
+journal = compatibility.FrameJournal(
+    f"journal-retinotopy-{params['direction']}-{params['timeStr']}.npy",
+    int((params['cycleTime']*params['nCycles'] + params['nullPeriod'])*frameRate) + 1024)
+
 
 # get rotation speed in deg/sec
 if params['direction'] == 'cw':
@@ -140,49 +167,97 @@ elif params['direction'] == 'con':
     cycleSpeed = 1.0/params['cycleTime']
 
 
+def saveRecords():
+    recorder.summary()
+    recorder.save(framesFile)
+    compatibility.saveRun(runFile, 'retinotopy', params, recorder.t0,
+                          frames=recorder.frames())
+
+
 def quit():
     print('user quit before end of run')
+    saveRecords()
     myWin.close()
     core.quit()
 
 
+# draw the stimulus (and its per-frame updates) once before the trigger
+def animateWedge(n):
+    wedge.setTime(n/frameRate)
+    wedge.setOri(cycleSpeed*n/frameRate)
+
+
+def animateAnnulus(n):
+    annulus.setTime(n/frameRate)
+    annulus.setPhase((cycleSpeed*n/frameRate) % 1)
+
+
+if params['direction'] in ['cw', 'ccw']:
+    compatibility.registerStim(wedge, animateWedge)
+else:
+    compatibility.registerStim(annulus, animateAnnulus)
+compatibility.registerStim(fixation)
+
 # update and wait for the go signal
 myWin.update()
 
 # from compatibility.py - reusable across code
 t0, tdelta = waitForScanner(myWin, fixation, method='digital')
+recorder.setAnchor(t0)
 
-fixationInfo = compatibility.showNullPeriod(
-    myWin, fixation, fixationInfo, params['nullPeriod'])
+task = compatibility.FixationTask(params['nullPeriod'], fixationInfo)
+task = compatibility.showNullPeriod(
+    myWin, fixation, task, params['nullPeriod'], recorder=recorder, t0=t0,
+    journal=journal)
 
 globalClock = core.Clock()
+tStart = core.getTime()
+# evaluate the stimulus for the flip it will be shown at, not for now
+predictor = compatibility.FlipPredictor(frameRate)
 g = 0
+frameN = 0
 lastSwitch = globalClock.getTime()
 
 while g < params['cycleTime']*params['nCycles']:
-    g = globalClock.getTime()
+    g = predictor.predict() - tStart
 
     if params['direction'] in ['cw', 'ccw']:
-        wedge.incrementPhase()
+        wedge.setTime(g)
         wedge.setOri(cycleSpeed*g)
         wedge.draw()
 
     elif params['direction'] in ['exp', 'con']:
-        annulus.incrementRotation()
+        annulus.setTime(g)
         annulus.setPhase((cycleSpeed*g) % 1)
         annulus.draw()
 
     fixation.draw()
     myWin.update()
+    predictor.flipped()
+    # state is the cycle we are in
+    recorder.record(frameN, int(g // params['cycleTime']))
+    if params['direction'] in ['cw', 'ccw']:
+        journal.record(frameN, int(g // params['cycleTime']), ori=cycleSpeed*g,
+                       fixColor=task.colorIndex())
+    else:
+        journal.record(frameN, int(g // params['cycleTime']),
+                       phase=(cycleSpeed*g) % 1, fixColor=task.colorIndex())
+    frameN += 1
 
-    for key in event.getKeys():
+    for key in compatibility.getKeys():
         if key in ['escape', 'q']:
+            journal.flagResponse(compatibility.RESPONSE_KEY_QUIT)
             quit()
+        elif key in compatibility.BUTTON_CODES:
+            # no task during the stimulus, but keep the presses with the frames
+            journal.flagResponse(compatibility.RESPONSE_BUTTON)
 
 print('%%%%%%%%%%%%%%%%%')
 print("completed %s run. t=%.2f. meanFPS=%.1f" %
       (params['direction'], globalClock.getTime(), myWin.fps()))
 print('%%%%%%%%%%%%%%%%%')
+saveRecords()
+predictor.report()
 
 compatibility.endExperiment(myWin)
 myWin.close()
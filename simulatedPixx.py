@@ -0,0 +1,223 @@
+# simulatedPixx.py
+
+# stand-in for pypixxlib's PROPixxCTRL, for running the stimulus scripts
+# off the scanner PC: a scripted scanner (TTL pulses every TR, with jitter)
+# and button box (ResponsePixx codes, as in checkResponsePIXX.py) on the DIN,
+# and a DOUT that just remembers what was written.
+#
+# compatibility.py picks this up with --simulate / MRIVIS_SIMULATE=1, or when
+# pypixxlib isn't installed. The scanner is set up from the environment:
+#   MRIVIS_SIM_TR       TR in seconds (2.0)
+#   MRIVIS_SIM_JITTER   sd of the pulse timing in seconds (0.0002)
+#   MRIVIS_SIM_DELAY    first pulse, seconds after connecting (2.0)
+#   MRIVIS_SIM_DROP     probability that a pulse goes missing (0.0)
+#   MRIVIS_SIM_PRESSES  random button presses per second (0.0)
+
+import os
+import time
+import numpy as np
+from psychopy import core
+
+# right hand button box of 2x5 setup (see checkResponsePIXX.py)
+BUTTON_CODES = {'blue': 64768, 'yellow': 64576, 'red': 64544,
+                'green': 64640, 'white': 65024}
+IDLE_CODE = 64512  # DIN with no button down ('button release')
+
+
+def _env(name, default):
+    return float(os.environ.get(name, default))
+
+
+class _Din:
+    """
+    DIN log, as pypixxlib's device.din (setDinLog / readDinLog etc.)
+    """
+
+    def __init__(self, device):
+        self._device = device
+        self._logStart = None
+        self._logStop = None
+
+    def setDinLog(self, bufferAddress=12e6, bufferSize=1000):
+        return {'bufferBaseAddress': int(bufferAddress),
+                'bufferSize': int(bufferSize),
+                'currentWriteFrame': 0,
+                'currentReadFrame': 0,
+                'newLogFrames': 0,
+                'numLogUnderflows': 0}
+
+    def startDinLog(self):
+        # events are logged from the next register update on
+        self._device._pending['logStart'] = True
+
+    def stopDinLog(self):
+        self._device._pending['logStop'] = True
+
+    def _logged(self):
+        # indices [start, stop) of the scripted events in the log
+        device = self._device
+        if self._logStart is None:
+            return 0, 0
+        start = np.searchsorted(device.eventTimes, self._logStart)
+        end = device._cacheTime if self._logStop is None else self._logStop
+        stop = np.searchsorted(device.eventTimes, end, side='right')
+        return start, max(start, stop)
+
+    def getDinLogStatus(self, log):
+        start, stop = self._logged()
+        log['currentWriteFrame'] = stop - start
+        log['newLogFrames'] = log['currentWriteFrame'] - log['currentReadFrame']
+        return log
+
+    def readDinLog(self, log, numFrames):
+        start, stop = self._logged()
+        first = start + log['currentReadFrame']
+        last = min(first + int(numFrames), stop)
+        log['currentReadFrame'] += last - first
+        device = self._device
+        return [[float(device.eventTimes[k]), int(device.eventValues[k])]
+                for k in range(first, last)]
+
+    def getValue(self):
+        device = self._device
+        k = np.searchsorted(device.eventTimes, device._cacheTime, side='right')
+        return int(device.eventValues[k-1]) if k > 0 else IDLE_CODE
+
+
+class _Dout:
+    """
+    DOUT, as pypixxlib's device.dout. Writes take effect on updateRegisterCache.
+    """
+
+    def __init__(self, device):
+        self._device = device
+        self.value = 0
+        self.log = []  # (device time, value) of every change
+
+    def setBitValue(self, value, bitMask):
+        value0, mask0 = self._device._pending.get('dout', (0, 0))
+        self._device._pending['dout'] = (
+            (value0 & ~bitMask) | (value & bitMask), mask0 | bitMask)
+
+    def getValue(self):
+        return self.value
+
+
+class PROPixxCTRL:
+    """
+    Simulated PROPixxCTRL: scripted scanner pulses and button presses.
+
+    Device time starts at 0 on connection and runs at (1 + clockDrift) times
+    host speed. Pulses (rising edge on triggerBit, falling pulseWidth later)
+    start firstTrigger seconds after connecting and repeat every tr, each
+    with gaussian jitter, and each lost with probability dropProb. Button
+    presses come from `buttons` - a list of (device time, name) - and/or at
+    random with pressRate per second. `latency` makes each register update
+    take that long, like the USB round trip to the real device. Writes
+    "after video sync" take effect on a frameRate grid of device time.
+    """
+
+    def __init__(self, tr=None, jitter=None, firstTrigger=None, dropProb=None,
+                 pressRate=None, buttons=None, triggerBit=0, pulseWidth=0.005,
+                 pressDuration=0.1, duration=3600.0, clockDrift=0.0,
+                 latency=0.0, frameRate=60.0, seed=None):
+        self.tr = _env('MRIVIS_SIM_TR', 2.0) if tr is None else tr
+        self.jitter = _env('MRIVIS_SIM_JITTER', 0.0002) if jitter is None else jitter
+        self.firstTrigger = _env('MRIVIS_SIM_DELAY', 2.0) if firstTrigger is None else firstTrigger
+        self.dropProb = _env('MRIVIS_SIM_DROP', 0.0) if dropProb is None else dropProb
+        pressRate = _env('MRIVIS_SIM_PRESSES', 0.0) if pressRate is None else pressRate
+        self.clockDrift = clockDrift
+        self.latency = latency
+        self.framePeriod = 1.0/frameRate
+        self.din = _Din(self)
+        self.dout = _Dout(self)
+        self._pending = {}
+        rng = np.random.default_rng(seed)
+
+        # scanner: every pulse, including the dropped ones (for checking)
+        nPulses = int((duration - self.firstTrigger)/self.tr) + 1
+        self.pulseTimes = (self.firstTrigger + np.arange(nPulses)*self.tr
+                           + rng.normal(0, self.jitter, nPulses))
+        self.pulseDropped = rng.random(nPulses) < self.dropProb
+        pulses = self.pulseTimes[~self.pulseDropped]
+        triggerCode = IDLE_CODE | (1 << triggerBit)
+        times = [pulses, pulses + pulseWidth]
+        values = [np.full(len(pulses), triggerCode), np.full(len(pulses), IDLE_CODE)]
+
+        # button box
+        presses = [] if buttons is None else list(buttons)
+        if pressRate > 0:
+            nPresses = rng.poisson(pressRate*duration)
+            pressTimes = np.sort(rng.uniform(0, duration, nPresses))
+            names = rng.choice(['blue', 'yellow', 'red', 'green'], nPresses)
+            presses += list(zip(pressTimes, names))
+        if presses:
+            pressTimes = np.array([t for (t, _) in presses], dtype=float)
+            times += [pressTimes, pressTimes + pressDuration]
+            values += [np.array([BUTTON_CODES[name] for (_, name) in presses]),
+                       np.full(len(presses), IDLE_CODE)]
+
+        times = np.concatenate(times)
+        order = np.argsort(times, kind='stable')
+        self.eventTimes = times[order]
+        self.eventValues = np.concatenate(values)[order].astype(np.uint32)
+
+        self._hostStart = time.perf_counter()
+        # core.getTime() has its own zero (or is GetSecs): keep the offset
+        self._hostOffset = core.getTime() - self._hostStart
+        self._cacheTime = 0.0
+        self.nUpdates = 0
+
+    def _deviceTime(self):
+        return (time.perf_counter() - self._hostStart)*(1.0 + self.clockDrift)
+
+    def toHost(self, deviceTime):
+        """
+        Host time (core.getTime) of a device time.
+        """
+        return (self._hostStart + self._hostOffset
+                + np.asarray(deviceTime)/(1.0 + self.clockDrift))
+
+    def _nextVideoSync(self):
+        return np.ceil(self._deviceTime()/self.framePeriod)*self.framePeriod
+
+    def _write(self, t):
+        # apply the pending register writes at device time t
+        if 'dout' in self._pending:
+            value, mask = self._pending.pop('dout')
+            newValue = (self.dout.value & ~mask) | (value & mask)
+            if newValue != self.dout.value:
+                self.dout.value = newValue
+                self.dout.log.append((t, newValue))
+        if self._pending.pop('logStart', None):
+            self.din._logStart = t
+            self.din._logStop = None
+        if self._pending.pop('logStop', None):
+            self.din._logStop = t
+
+    def updateRegisterCache(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self._cacheTime = self._deviceTime()
+        self._write(self._cacheTime)
+        self.nUpdates += 1
+
+    def writeRegCacheAfterVideoSync(self):
+        # as _libdpx.DPxWriteRegCacheAfterVideoSync: returns straight away
+        if self.latency:
+            time.sleep(self.latency)
+        self._write(self._nextVideoSync())
+        self.nUpdates += 1
+
+    def updateRegCacheAfterVideoSync(self):
+        # as _libdpx.DPxUpdateRegCacheAfterVideoSync: blocks until the sync
+        tSync = self._nextVideoSync()
+        time.sleep(max(tSync - self._deviceTime(), 0)/(1.0 + self.clockDrift))
+        self.updateRegisterCache()
+
+    def getTime(self):
+        # time of the last register update, as on the real device
+        return self._cacheTime
+
+    def close(self):
+        pass
@@ -0,0 +1,50 @@
+# test_batchedAnnulus.py
+
+# BatchedSlidingAnnulus has to show the same rings, at the same radii, as
+# SlidingAnnulus does with one RadialStim mask per ring. Only the radial
+# layout is compared (no window / GL context needed): the objects are made
+# without their stims.
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import compatibility  # noqa: E402
+
+
+def makeAnnuli(dutyCycle=0.25, nRings=4, nRadial=64):
+    ringWidth = dutyCycle/nRings
+    annulus = compatibility.SlidingAnnulus.__new__(compatibility.SlidingAnnulus)
+    annulus.ringWidth = ringWidth
+    annulus.nRings = nRings
+    batched = compatibility.BatchedSlidingAnnulus.__new__(compatibility.BatchedSlidingAnnulus)
+    batched.ringWidth = ringWidth
+    batched.nRings = nRings
+    batched._bandRadius = (np.arange(nRadial) + 0.5)/nRadial
+    return annulus, batched
+
+
+@pytest.mark.parametrize('phase', np.linspace(0, 1, 97)[:-1])
+def test_batchedMatchesRingMasks(phase):
+    annulus, batched = makeAnnuli()
+    # ring shown in each of the 64 mask samples (nRings = none)
+    expected = np.full(64, annulus.nRings)
+    for n, mask in enumerate(annulus.ringMasks(phase)):
+        expected[mask == 1] = n
+    bandRing = batched.bandRings(phase)
+
+    # SlidingAnnulus samples its masks at k/63 (quantised to 1/128), the
+    # bands sit at (k + 0.5)/64: they may only differ next to a ring edge
+    edge = np.zeros(64, dtype=bool)
+    changes = expected[1:] != expected[:-1]
+    edge[1:] |= changes
+    edge[:-1] |= changes
+    assert not np.any((bandRing != expected) & ~edge)
+    # and most of each ring is where it should be
+    assert np.mean(bandRing == expected) > 0.9
@@ -0,0 +1,44 @@
+# test_batchedWedge.py
+
+# BatchedSlidingWedge has to put the same radial phase into its texture
+# coordinates as SlidingWedge does with one RadialStim per segment.
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from psychopy import visual  # noqa: E402
+import compatibility  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def myWin():
+    try:
+        win = visual.Window(size=(64, 64), allowGUI=False, units='height')
+    except Exception as e:  # no display
+        pytest.skip(f"no window: {e}")
+    yield win
+    win.close()
+
+
+@pytest.mark.parametrize('t', [0.0, 0.37, 2.5])
+def test_batchedMatchesSegments(myWin, t):
+    wedge = compatibility.SlidingWedge(myWin, size=1.0, pos=[0, 0], seed=3)
+    batched = compatibility.BatchedSlidingWedge(myWin, size=1.0, pos=[0, 0], seed=3)
+    wedge.setTime(t)
+    batched.setTime(t)
+
+    stim = batched.stim
+    texCoords = stim._visibleTexture.reshape(-1, 3, 2)[:, :, 1]
+    angles = stim._angles[stim._visible]
+    for n, seg in enumerate(wedge.segments):
+        expected = seg._visibleTexture.reshape(-1, 3, 2)[:, :, 1]
+        inSeg = np.isin(angles, seg._angles[seg._visible]) & (batched._triSeg == n)
+        assert inSeg.sum() == len(expected)
+        np.testing.assert_allclose(texCoords[inSeg], expected, atol=1e-6)
@@ -0,0 +1,81 @@
+# test_checkVolumes.py
+
+# checkVolumes(): missing volumes (inside the run and after the last
+# pulse), extra pulses, effective TR and stimulus-scanner drift.
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import compatibility  # noqa: E402
+
+
+def makePulses(deviceTimes, hostTimes=None):
+    pulses = np.zeros(len(deviceTimes), dtype=compatibility.DIN_EVENT_DTYPE)
+    pulses['time'] = deviceTimes
+    pulses['host'] = deviceTimes if hostTimes is None else hostTimes
+    return pulses
+
+
+class LinearSync:
+    # stands in for ClockSync: host = slope*device
+    def __init__(self, slope):
+        self.slope = slope
+
+    def toHost(self, deviceTimes):
+        return self.slope*np.asarray(deviceTimes, dtype=float)
+
+
+def test_completeRun():
+    result = compatibility.checkVolumes(makePulses(np.arange(100)*2.0), tr=2.0)
+    assert result['nVolumes'] == 100
+    assert len(result['missing']) == 0
+    assert result['nExtra'] == 0
+    assert result['effectiveTR'] == pytest.approx(2.0)
+    assert result['drift'] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_missingAndExtra():
+    t = np.arange(50)*2.0
+    t = np.delete(t, [10, 11, 30])
+    t = np.sort(np.append(t, [40.02]))  # a double pulse at volume 20
+    result = compatibility.checkVolumes(makePulses(t), tr=2.0)
+    assert result['nVolumes'] == 50
+    np.testing.assert_array_equal(result['missing'], [10, 11, 30])
+    assert result['nExtra'] == 1
+
+
+def test_missingAfterLastPulse():
+    # the stimulus ran 10 volumes longer than the pulses
+    result = compatibility.checkVolumes(makePulses(np.arange(20)*2.0), tr=2.0,
+                                        tEnd=59.0)
+    assert result['nTrailing'] == 10
+
+
+def test_trFromPulses():
+    result = compatibility.checkVolumes(makePulses(np.arange(30)*1.5))
+    assert result['nVolumes'] == 30
+    assert result['effectiveTR'] == pytest.approx(1.5)
+
+
+def test_driftFromClockSync():
+    # host clock 50 ppm fast: 10 ms over 200 s
+    t = np.arange(101)*2.0
+    result = compatibility.checkVolumes(makePulses(t), tr=2.0,
+                                        clockSync=LinearSync(1 + 50e-6))
+    assert result['drift'] == pytest.approx(0.01)
+
+
+def test_driftFromReadTimes():
+    # without a clock sync, fitted on the (jittery) host read times
+    t = np.arange(101)*2.0
+    rng = np.random.default_rng(0)
+    host = t*(1 + 50e-6) + rng.uniform(0, 0.002, len(t))
+    result = compatibility.checkVolumes(makePulses(t, host), tr=2.0)
+    assert result['drift'] == pytest.approx(0.01, abs=0.001)
@@ -0,0 +1,59 @@
+# test_compileSchedule.py
+
+# compileSchedule(): block onsets anchored to the trigger (rounded to the
+# nearest frame, no accumulated drift), zero-length blocks, polarity and
+# fixation periods.
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import compatibility  # noqa: E402
+
+
+def blockOnsets(schedule):
+    return np.flatnonzero(np.diff(schedule['block'], prepend=-1))
+
+
+def test_onsetsAnchoredToTrigger():
+    # 12 s blocks at a refresh rate that isn't a whole number of frames per
+    # block: each onset is the frame nearest to k*12 s, with no drift
+    frameRate = 59.94
+    blocks = [(1, 12.0), (0, 12.0)]*10
+    schedule = compatibility.compileSchedule(blocks, frameRate)
+    onsets = blockOnsets(schedule)
+    expected = np.round(np.arange(20)*12.0*frameRate).astype(int)
+    np.testing.assert_array_equal(onsets, expected)
+    assert len(schedule) == int(round(240*frameRate))
+    np.testing.assert_allclose(schedule['time'], np.arange(len(schedule))/frameRate)
+
+
+def test_zeroLengthBlocksAreSkipped():
+    blocks = [(1, 1.0), (2, 0.0), (0, 1.0)]
+    schedule = compatibility.compileSchedule(blocks, 60.0)
+    assert len(schedule) == 120
+    assert 1 not in schedule['block']
+    np.testing.assert_array_equal(np.unique(schedule['stim']), [0, 1])
+    np.testing.assert_array_equal(blockOnsets(schedule), [0, 60])
+
+
+def test_polarityRestartsAtBlockOnsets():
+    # 0.25 s flash period: 7.5 frames positive, then negative
+    blocks = [(1, 0.1), (2, 1.0), (0, 1.0)]
+    schedule = compatibility.compileSchedule(blocks, 60.0, flashPeriod=0.25)
+    start = blockOnsets(schedule)[1]
+    np.testing.assert_array_equal(schedule['polarity'][start:start + 8], 1)
+    assert schedule['polarity'][start + 8] == -1
+    # blanks have no polarity
+    assert np.all(schedule['polarity'][schedule['stim'] == 0] == 0)
+
+
+def test_fixationPeriodsFromTrigger():
+    schedule = compatibility.compileSchedule([(1, 2.0)], 60.0, fixLength=0.5)
+    np.testing.assert_array_equal(schedule['fixation'], np.arange(120)//30)
@@ -0,0 +1,83 @@
+# test_fixationTask.py
+
+# FixationTask.score() rules, as the old per-frame counting in the scripts:
+# the first press within responseWindow of a target is a hit, a press
+# after a missed target's window is ignored, presses before the first
+# target or after a hit are false alarms.
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psychopy')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import compatibility  # noqa: E402
+
+
+def makeTask(targetOnsets, presses, fixLength=1.0, nPeriods=10):
+    # targets at the given onsets, on a grid of fixLength periods
+    task = compatibility.FixationTask(nPeriods*fixLength, dict(
+        compatibility.FIXATION_INFO, fixLength=fixLength, responseWindow=1.0), seed=1)
+    task.onsets = np.arange(nPeriods)*fixLength
+    task.isTarget = np.isin(task.onsets, targetOnsets)
+    for t in presses:
+        task.respond(t)
+    return task
+
+
+def test_hit():
+    result = makeTask([2.0], [2.4]).score()
+    assert result['nTargs'] == 1
+    assert (result['nTargsH'], result['nTargsF'], result['nTargsC']) == (1, 0, 1)
+    np.testing.assert_allclose(result['rt'], [0.4])
+    assert result['score'] == 100.0
+    assert list(result['hit']) == [True]
+
+
+def test_lateSecondPressAfterHitIsFalseAlarm():
+    result = makeTask([2.0], [2.4, 2.6, 5.0]).score()
+    assert (result['nTargsH'], result['nTargsF'], result['nTargsC']) == (1, 2, 0)
+
+
+def test_pressAfterMissedTargetIsIgnored():
+    # outside the window of an unhit target: neither a hit nor a false alarm
+    result = makeTask([2.0, 6.0], [3.5, 4.0, 6.2]).score()
+    assert (result['nTargsH'], result['nTargsF']) == (1, 0)
+    assert list(result['hit']) == [False, True]
+    np.testing.assert_allclose(result['rt'], [0.2])
+
+
+def test_pressBeforeFirstTargetIsFalseAlarm():
+    result = makeTask([4.0], [1.0, 4.5]).score()
+    assert (result['nTargsH'], result['nTargsF'], result['nTargsC']) == (1, 1, 0)
+
+
+def test_onlyFirstPressCounts():
+    # the first press decides: a late first press misses the target
+    result = makeTask([2.0], [3.2, 3.3]).score()
+    assert (result['nTargsH'], result['nTargsF']) == (0, 0)
+    assert np.isnan(result['meanRT'])
+
+
+def test_noTargets():
+    result = makeTask([], [1.0, 2.0]).score()
+    assert (result['nTargs'], result['nTargsH'], result['nTargsF']) == (0, 0, 2)
+    assert np.isnan(result['score'])
+    assert len(result['hit']) == 0
+
+
+def test_noTargetsBeforeUntil():
+    # presses, and a target only after until
+    result = makeTask([8.0], [1.0, 8.2]).score(until=5.0)
+    assert (result['nTargs'], result['nTargsF']) == (0, 2)
+    assert np.isnan(result['score'])
+
+
+def test_untilDropsLaterTargets():
+    result = makeTask([2.0, 8.0], [2.5]).score(until=5.0)
+    assert result['nTargs'] == 1
+    assert result['score'] == 100.0
@@ -6,9 +6,8 @@
 # additional refactoring by ds
 # can use saved values in retinotopy.py
 
-from psychopy import visual, event, core, monitors, gui, misc, plugins
-from psychopy import monitors
-import scipy
+from psychopy import visual, event, core, monitors, misc
+import numpy as np
 import compatibility
 
 # try:
@@ -16,7 +15,7 @@ import compatibility
 #    visField = misc.fromFile('visualFieldParams.pickle')
 # if no file use some defaults
 # except:
-visField = {'centre': scipy.array((0.0, 0.0)),
+visField = {'centre': np.array((0.0, 0.0)),
             'size': 6.0}
 
 # @TODO pick up actual params from local store
@@ -88,6 +87,7 @@ while carryOn:  # quits after 20 secs
     event.clearEvents()
 
 myWin.close()
+from psychopy import gui  # only needed from here on
 saveDlg = gui.Dlg('Save params')
 saveDlg.addText('Save params to file? (cancel to leave previous params)')
 wasOk = saveDlg.show()
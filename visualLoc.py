@@ -16,12 +16,17 @@
 # parameters can be set either via commnand line arguments or GUI
 # if all arguments passed in, assume user is happy with parameters and GUI will not appear
 
-from psychopy import core, visual, event, gui, data
+from psychopy import core, visual, event, data
 from psychopy.tools.filetools import fromFile,toFile # saving and loading parameter files
 from numpy import sin, pi
 import math,sys,time
 import numpy as np
 
+# provide a compatibility layer for newer versions of PsychoPy
+# (block schedule compiler)
+import compatibility
+import protocol
+
 if len(sys.argv)>1:
     blockLengthOn=float(sys.argv[1])
 else:
@@ -63,6 +68,7 @@ params = {
 params['timeStr']= time.strftime("%y_%b_%d_%H%M%S", time.localtime())
 
 if len(sys.argv)<6:
+    from psychopy import gui  # only loaded when the dialog is shown
     dlg = gui.DlgFromDict(
             dictionary=params,
             title="Visual Localizer",
@@ -124,127 +130,18 @@ wedge2 = visual.RadialStim(myWin, tex='sqrXsqr', color=-1,size=stimSize,
 message1 = visual.TextStim(myWin, pos=[0,+.5], wrapWidth=1.5, color='#000000', alignText='center', name='topMsg', text="aaa",units='norm')
 message2 = visual.TextStim(myWin, pos=[0,-.5], wrapWidth=1.5, color='#000000', alignText='center', name='bottomMsg', text="bbb",units='norm')
 
-# wait for scanner
-message1.setText("Please fixate on the central dot during the visual task")
-message2.setText("Press a button when you see a yellow dot at fixation")
-message1.draw()
-message2.draw()
-myWin.flip()
-event.waitKeys()
-
-
-kwait = 1
-while kwait:
-    fixation.draw()
-    myWin.flip()
-    for key in event.getKeys():
-        if key in ['5','t']:
-            kwait = 0
-        elif key in ['escape','q']:
-            print(myWin.fps())
-            myWin.close()
-            core.quit()
-
-clock=core.Clock()
-
-color_key = 'white'
-fn = 0;
-trialClock = core.Clock()
-
-t = lastFPSupdate = 0
-t_p = 0
-
-nTargs = 0;
-nTargsH = 0;
-nTargsC = 0;
-nTargsF = 0;
-targTime= 1000;
-targFlag=0;
-
-while trialClock.getTime()<nullPeriod:#for 5 secs
-    t=trialClock.getTime()
-    t_diff=t-t_p
-    if t_diff > fixLength:
-        old_color_key = color_key
-        fnPrev = fn
-        while color_key == old_color_key: 
-            fn = np.random.randint(len(my_colors.keys()))
-            color_key = list(my_colors.keys())[fn]
-        this_color = my_colors[color_key]
-        fixation.setColor(this_color)
-        if fn>2:
-            nTargs = nTargs + 1
-            targTime = trialClock.getTime()
-            targFlag = 1
-        t_p = t
-    fixation.draw()
-    myWin.flip()
-    for key in event.getKeys():
-        keyTime=trialClock.getTime()
-        if key in ['escape','q']:
-            myWin.close()
-            core.quit()
-        elif key in ['1','2','3','4']:
-            if targFlag:
-                if (keyTime-targTime)<1:
-                    nTargsC=nTargsC+1
-                    nTargsH=nTargsH+1
-                    targFlag=0
-            else:
-                nTargsC=nTargsC-1
-                nTargsF=nTargsF+1
-
-t = lastFPSupdate = 0
-t_p = 0
-for i in range(0,(numBlocks)):
-    trialClock.reset()
-    t_p= 0
-    while trialClock.getTime()<(blockLengthOn+blockLengthOff):#for 5 secs
-        t=trialClock.getTime()
-        t_diff=t-t_p
-        if t_diff > fixLength:
-            old_color_key = color_key
-            fnPrev = fn
-            while color_key == old_color_key: 
-                fn = np.random.randint(len(my_colors.keys()))
-                color_key = list(my_colors.keys())[fn]
-            this_color = my_colors[color_key]
-            fixation.setColor(this_color)
-            if fn>2:
-                nTargs = nTargs + 1
-                targTime = trialClock.getTime()
-                targFlag=1
-            t_p = t
-        if trialClock.getTime()<blockLengthOn:
-            if (t%flashPeriod) < (flashPeriod/2.0):# (NB more accurate to use number of frames)
-                stim = wedge1
-            else:
-                stim = wedge2
-            stim.draw()
-        fixation.draw()
-        myWin.flip()
-        for key in event.getKeys():
-            keyTime=trialClock.getTime()
-            if key in ['escape','q']:
-                myWin.close()
-                core.quit()
-            elif key in ['1','2','3','4']:
-                if targFlag:
-                    if (keyTime-targTime)<1:
-                        nTargsC=nTargsC+1
-                        nTargsH=nTargsH+1
-                        targFlag=0
-                else:
-                    nTargsC=nTargsC-1
-                    nTargsF=nTargsF+1
+# stimulus ids in the schedule: 0 blank, 1 full field (+/- contrast)
+layers = {1: protocol.Layer((wedge1, wedge2))}
 
-nTargsC=max(nTargsC,0)
-print("nTargs:", int(nTargs))
-print("nTargsH:", int(nTargsH))
-print("nTargsF:", int(nTargsF))
-print("nTargsC:", int(nTargsC))
+# null period, then on/off blocks
+blocks = [(0, nullPeriod)] + [(1, blockLengthOn), (0, blockLengthOff)]*numBlocks
 
-print("Score: %.2f" % (nTargsC/nTargs*100))
+# trigger from the keyboard ('5' / 't'), as before
+run = protocol.Protocol('visualLoc', blocks, layers, fixation, flashPeriod,
+                        fixationInfo=dict(compatibility.FIXATION_INFO,
+                                          my_colors=my_colors, fixLength=fixLength),
+                        stimNames={1: 'fullfield'}, method='keyboard').compile(myWin)
+run.run(params)
 
 message1.setText("Thank you!")
 message2.setText("Press 'q' or 'escape' to end the session.")